@@ -1,6 +1,8 @@
+import time
 from model import Model2048
-from expectiminimax import Expectiminimax2048
+from expectiminimax import Expectiminimax2048, DepthPolicy
 from montecarlo import MonteCarlo2048
+from batch import BatchModel2048
 
 def testExpectiminimax():
     model = Model2048()
@@ -43,6 +45,31 @@ def testExpectiminimax():
             f.write(f"E{i} Highest Tile Sum: {sum(e_highest_tiles_all[i-1])}, Avg: {sum(e_highest_tiles_all[i-1]) / 20}" + "\n")
         f.write("\n")
 
+def testDepthPolicy():
+    model = Model2048()
+    solvers = [
+        ("Fixed depth 3", Expectiminimax2048(3, 3, cache_size=200000)),
+        ("Fixed depth 5", Expectiminimax2048(5, 3, cache_size=200000)),
+        ("Adaptive depth", Expectiminimax2048(5, 3, cache_size=200000, depth_policy=DepthPolicy())),
+    ]
+
+    with open("data/output_4.txt", "w") as f:
+        for name, expectiminimax in solvers:
+            print(name)
+            d_scores = []
+            start_time = time.process_time()
+            for j in range(20):
+                print(j)
+                while not model.gameOver():
+                    direction = expectiminimax.getNextDirectionPacked(model.getPackedBoard())
+                    model.playAction(direction)
+                d_scores.append(model.getScore())
+                model.restart()
+            cpu_seconds = time.process_time() - start_time
+            f.write(f"{name} | Scores: {d_scores}" + "\n")
+            f.write(f"{name} | Score Avg: {sum(d_scores) / 20}, CPU Seconds: {cpu_seconds}, Score per CPU Second: {sum(d_scores) / cpu_seconds}" + "\n")
+            f.write("\n")
+
 def testMonteCarlo():
     model = Model2048()
     m_scores_all = []
@@ -86,8 +113,23 @@ def testMonteCarlo():
             f.write(f"E{i} | C: {i/4} | Highest Tile Sum: {sum(m_highest_tiles_all[i-1])}, Avg: {sum(m_highest_tiles_all[i-1]) / 20}" + "\n")
         f.write("\n")
 
+def testRandom():
+    batch_size = 10000
+    print(f"Random: {batch_size} games")
+    batch = BatchModel2048(batch_size)
+    batch.playRandom()
+    r_scores = batch.getScores()
+    r_highest_tiles = batch.getHighestTiles()
+
+    with open("data/output_3.txt", "w") as f:
+        f.write(f"R Score Sum: {r_scores.sum()}, Avg: {r_scores.mean()}, Max: {r_scores.max()}" + "\n")
+        f.write(f"R Highest Tile Sum: {r_highest_tiles.sum()}, Avg: {r_highest_tiles.mean()}, Max: {r_highest_tiles.max()}" + "\n")
+        f.write("\n")
+
 def main():
     #testExpectiminimax()
+    #testRandom()
+    #testDepthPolicy()
     testMonteCarlo()
 
 if __name__ == '__main__':
@@ -0,0 +1,310 @@
+import numpy as np
+import time
+from bitboard import ROW_LEFT, ROW_RIGHT, ROW_SCORE, ROW_CHANGED_LEFT, ROW_CHANGED_RIGHT
+from engine import DIRECTION_UP, DIRECTION_DOWN, DIRECTION_LEFT, DIRECTIONS
+
+# NumPy copies of the engine row tables, indexed by a packed 16-bit row
+ROW_LEFT_ARRAY = np.array(ROW_LEFT, dtype=np.uint64)
+ROW_RIGHT_ARRAY = np.array(ROW_RIGHT, dtype=np.uint64)
+ROW_SCORE_ARRAY = np.array(ROW_SCORE, dtype=np.int64)
+ROW_CHANGED_ARRAY = np.array(ROW_CHANGED_LEFT, dtype=bool) | np.array(ROW_CHANGED_RIGHT, dtype=bool)
+
+ROW_MASK = np.uint64(0xFFFF)
+CELL_MASK = np.uint64(0xF)
+ROW_SHIFTS = np.array([0, 16, 32, 48], dtype=np.uint64)
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+def transposeBatch(boards: np.ndarray) -> np.ndarray:
+    """
+    This transposes every packed board in the array, swapping the cells (y, x) and (x, y).
+
+    :param boards: The packed boards.
+    :type boards: np.ndarray
+    :return: The transposed packed boards.
+    :rtype: np.ndarray
+    """
+    a1 = boards & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = boards & np.uint64(0x0000F0F00000F0F0)
+    a3 = boards & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+def getExponentsBatch(boards: np.ndarray) -> np.ndarray:
+    """
+    This splits every packed board into its 16 cell exponents.
+
+    :param boards: The packed boards.
+    :type boards: np.ndarray
+    :return: An (N, 16) array of exponents, cell (y, x) at column 4*y + x.
+    :rtype: np.ndarray
+    """
+    return ((boards[:, None] >> CELL_SHIFTS) & CELL_MASK).astype(np.int8)
+
+def moveBatch(boards: np.ndarray, direction: int) -> tuple:
+    """
+    This shifts every packed board in the array in the same direction, the vectorized engine.move.
+
+    :param boards: The packed boards.
+    :type boards: np.ndarray
+    :param direction: The direction to shift the board tiles: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+    :type direction: int
+    :return: The shifted packed boards, the score gained by each, and a mask of the boards that changed.
+    :rtype: tuple
+    """
+    vertical = direction == DIRECTION_UP or direction == DIRECTION_DOWN
+    rows_board = transposeBatch(boards) if vertical else boards
+    rows = ((rows_board[:, None] >> ROW_SHIFTS) & ROW_MASK).astype(np.intp)
+    row_table = ROW_LEFT_ARRAY if direction == DIRECTION_UP or direction == DIRECTION_LEFT else ROW_RIGHT_ARRAY
+    final_boards = np.bitwise_or.reduce(row_table[rows] << ROW_SHIFTS, axis=1)
+    if vertical: final_boards = transposeBatch(final_boards)
+    scores = ROW_SCORE_ARRAY[rows].sum(axis=1)
+    return final_boards, scores, final_boards != boards
+
+def canMoveBatch(boards: np.ndarray) -> np.ndarray:
+    """
+    This checks which packed boards have at least one legal move.
+
+    :param boards: The packed boards.
+    :type boards: np.ndarray
+    :return: A mask of the boards that can still change.
+    :rtype: np.ndarray
+    """
+    rows = ((boards[:, None] >> ROW_SHIFTS) & ROW_MASK).astype(np.intp)
+    cols = ((transposeBatch(boards)[:, None] >> ROW_SHIFTS) & ROW_MASK).astype(np.intp)
+    return ROW_CHANGED_ARRAY[rows].any(axis=1) | ROW_CHANGED_ARRAY[cols].any(axis=1)
+
+def getRowScoresBatch(boards: np.ndarray, row_tables: list) -> np.ndarray:
+    """
+    This scores every packed board as a sum of 4 per-row lookups, e.g, into the snake heuristic row tables.
+
+    :param boards: The packed boards.
+    :type boards: np.ndarray
+    :param row_tables: The 4 row score arrays, one per board row.
+    :type row_tables: list
+    :return: The board scores.
+    :rtype: np.ndarray
+    """
+    rows = ((boards[:, None] >> ROW_SHIFTS) & ROW_MASK).astype(np.intp)
+    table_0, table_1, table_2, table_3 = row_tables
+    return table_0[rows[:, 0]] + table_1[rows[:, 1]] + table_2[rows[:, 2]] + table_3[rows[:, 3]]
+
+def rolloutBatch(boards: np.ndarray, players_turn: bool, num_turns: int, rng: np.random.Generator, deadline: float = None) -> np.ndarray:
+    """
+    This plays every packed board forward for a number of turns, a uniformly random legal move on the player's turns
+    and a random 2 or 4 tile spawn on the game's turns. A board without a legal move stays as it is.
+
+    :param boards: The packed boards to start from.
+    :type boards: np.ndarray
+    :param players_turn: If the first turn is the player's turn to shift tiles.
+    :type players_turn: bool
+    :param num_turns: The number of turns, player's and game's, to play.
+    :type num_turns: int
+    :param rng: The random number generator of the moves and spawns.
+    :type rng: np.random.Generator
+    :param deadline: The time.perf_counter() deadline after which no more turns are played, None plays every turn.
+    :type deadline: float
+    :return: The final packed boards.
+    :rtype: np.ndarray
+    """
+    num_games = len(boards)
+    games = np.arange(num_games)
+    game_over = np.zeros(num_games, dtype=bool)
+    shifted_boards = np.empty((num_games, len(DIRECTIONS)), dtype=np.uint64)
+    for _ in range(num_turns):
+        if deadline is not None and time.perf_counter() > deadline: break
+        if players_turn:
+            rows = ((boards[:, None] >> ROW_SHIFTS) & ROW_MASK).astype(np.intp)
+            cols = ((transposeBatch(boards)[:, None] >> ROW_SHIFTS) & ROW_MASK).astype(np.intp)
+            # Every direction at once, the columns in UP, DOWN, LEFT, RIGHT order
+            shifted_boards[:, 0] = transposeBatch(np.bitwise_or.reduce(ROW_LEFT_ARRAY[cols] << ROW_SHIFTS, axis=1))
+            shifted_boards[:, 1] = transposeBatch(np.bitwise_or.reduce(ROW_RIGHT_ARRAY[cols] << ROW_SHIFTS, axis=1))
+            shifted_boards[:, 2] = np.bitwise_or.reduce(ROW_LEFT_ARRAY[rows] << ROW_SHIFTS, axis=1)
+            shifted_boards[:, 3] = np.bitwise_or.reduce(ROW_RIGHT_ARRAY[rows] << ROW_SHIFTS, axis=1)
+            legal = shifted_boards != boards[:, None]
+            game_over |= ~legal.any(axis=1)
+            if game_over.all(): break
+            # A uniform random key per legal direction, the largest key picks the direction
+            keys = np.where(legal, rng.random(legal.shape), -1.0)
+            boards = shifted_boards[games, np.argmax(keys, axis=1)] # Without a legal direction, every shift is the board itself
+        else:
+            open_cells = getExponentsBatch(boards) == 0
+            keys = np.where(open_cells, rng.random(open_cells.shape), -1.0)
+            cells = np.argmax(keys, axis=1).astype(np.uint64)
+            exponents = np.where(rng.random(num_games) < BatchModel2048.TILE_2_CHANCE, 1, 2).astype(np.uint64)
+            boards = np.where(open_cells.any(axis=1), boards | (exponents << (cells * np.uint64(4))), boards)
+        players_turn = not players_turn
+    return boards
+
+class BatchModel2048:
+    """
+    This holds N games of 2048 and plays them in lockstep with vectorized NumPy calls.
+    Each game follows the same rules and per-game state as Model2048: a packed board, a score, and a game over flag.
+    """
+
+    TILE_2_CHANCE = 0.9
+    TILE_4_CHANCE = 0.1
+
+    def __init__(self, num_games: int, seed: int = None):
+        """
+        This initializes N 2048 games with zero scores and boards with two, random 2 or 4, tiles.
+
+        :param num_games: The number of games to hold in the batch.
+        :type num_games: int
+        :param seed: The seed for the tile spawns, None for a random seed.
+        :type seed: int
+        """
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+        self.restart()
+
+    def restart(self):
+        """
+        This restarts every game with a zero score and a board with two, random 2 or 4, tiles.
+        """
+        self.boards = np.zeros(self.num_games, dtype=np.uint64)
+        self.scores = np.zeros(self.num_games, dtype=np.int64)
+        self.game_over = np.zeros(self.num_games, dtype=bool)
+        self.moves = np.zeros(self.num_games, dtype=np.int64)
+        all_games = np.ones(self.num_games, dtype=bool)
+        self.addTile(all_games)
+        self.addTile(all_games)
+
+    def addTile(self, mask: np.ndarray) -> np.ndarray:
+        """
+        This adds a new 2 or 4 tile in one of the open cells of every selected board.
+
+        :param mask: The boards that should get a new tile.
+        :type mask: np.ndarray
+        :return: A mask of the boards that got a new tile.
+        :rtype: np.ndarray
+        """
+        open_cells = getExponentsBatch(self.boards) == 0
+        added = mask & open_cells.any(axis=1)
+        # A uniform random key per open cell, the largest key picks the cell
+        keys = np.where(open_cells, self.rng.random(open_cells.shape), -1.0)
+        cells = np.argmax(keys, axis=1).astype(np.uint64)
+        exponents = np.where(self.rng.random(self.num_games) < self.TILE_2_CHANCE, 1, 2).astype(np.uint64)
+        self.boards = np.where(added, self.boards | (exponents << (cells * np.uint64(4))), self.boards)
+        return added
+
+    def updateGameOver(self):
+        """
+        This checks which games are over, i.e, no tiles can move or merge.
+        """
+        self.game_over |= ~canMoveBatch(self.boards)
+
+    def shift(self, directions: np.ndarray) -> np.ndarray:
+        """
+        This shifts the tiles of every game that is not over, each in its own direction.
+
+        :param directions: The direction to shift each board: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :type directions: np.ndarray
+        :return: A mask of the boards whose tiles changed positions.
+        :rtype: np.ndarray
+        """
+        boards_changed = np.zeros(self.num_games, dtype=bool)
+        for direction in DIRECTIONS:
+            selected = (directions == direction) & ~self.game_over
+            if not selected.any(): continue
+            final_boards, scores, changed = moveBatch(self.boards[selected], direction)
+            self.boards[selected] = final_boards
+            self.scores[selected] += scores
+            boards_changed[selected] = changed
+        return boards_changed
+
+    def playAction(self, directions: np.ndarray) -> np.ndarray:
+        """
+        This shifts every game in its direction, adds a 2 or 4 tile to the boards that changed, and updates game over.
+
+        :param directions: The direction to shift each board: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :type directions: np.ndarray
+        :return: A mask of the boards whose tiles changed positions.
+        :rtype: np.ndarray
+        """
+        boards_changed = self.shift(directions)
+        self.moves += boards_changed
+        self.addTile(boards_changed)
+        self.updateGameOver()
+        return boards_changed
+
+    def playRandom(self, max_turns: int = 100000) -> int:
+        """
+        This plays every game to the end with uniformly random directions, like Model2048.autoRandomCLI.
+
+        :param max_turns: The max number of turns to play before stopping.
+        :type max_turns: int
+        :return: The number of turns played.
+        :rtype: int
+        """
+        turns = 0
+        self.updateGameOver()
+        while turns < max_turns and not self.game_over.all():
+            self.playAction(self.rng.integers(1, 5, self.num_games))
+            turns += 1
+        return turns
+
+    def getHighestTiles(self) -> np.ndarray:
+        """
+        This gets the highest tile on every board.
+
+        :return: The highest tile of each game.
+        :rtype: np.ndarray
+        """
+        highest_exponents = np.maximum(getExponentsBatch(self.boards).max(axis=1), 1).astype(np.int64)
+        return np.left_shift(1, highest_exponents)
+
+    def getBoards(self) -> np.ndarray:
+        """
+        This gets the packed boards of every game.
+
+        :return: The packed boards.
+        :rtype: np.ndarray
+        """
+        return self.boards
+
+    def getScores(self) -> np.ndarray:
+        """
+        This gets the score of every game.
+
+        :return: The game scores.
+        :rtype: np.ndarray
+        """
+        return self.scores
+
+    def gameOver(self) -> np.ndarray:
+        """
+        This gets which games are over.
+
+        :return: A mask of the games that are over.
+        :rtype: np.ndarray
+        """
+        return self.game_over
+
+def simulateBoardBatch(board: int, players_turn: bool, num_turns: int, num_rollouts: int, rng: np.random.Generator, row_tables: list,
+                       deadline: float = None) -> float:
+    """
+    This plays many random rollouts from the given packed board at once and returns the mean score of their final boards,
+    the batched simulation step of MonteCarlo2048.
+
+    :param board: The packed board to simulate from.
+    :type board: int
+    :param players_turn: If it is the player's turn to shift tiles on the board.
+    :type players_turn: bool
+    :param num_turns: The number of turns, player's and game's, to play.
+    :type num_turns: int
+    :param num_rollouts: The number of rollouts to play.
+    :type num_rollouts: int
+    :param rng: The random number generator of the moves and spawns.
+    :type rng: np.random.Generator
+    :param row_tables: The 4 row score arrays the final boards are scored with.
+    :type row_tables: list
+    :param deadline: The time.perf_counter() deadline after which no more turns are played, None plays every turn.
+    :type deadline: float
+    :return: The mean score of the final boards.
+    :rtype: float
+    """
+    boards = rolloutBatch(np.full(num_rollouts, board, dtype=np.uint64), players_turn, num_turns, rng, deadline)
+    return float(getRowScoresBatch(boards, row_tables).mean())
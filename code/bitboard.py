@@ -0,0 +1,333 @@
+"""
+This holds the helpers for the packed 64-bit representation of a 2048 board.
+
+Each of the 16 cells is stored as a 4-bit exponent, i.e, a tile of 2**e is stored as e and a blank cell as 0.
+Cell (y, x) lives in the nibble at index 4*y + x, so row y is the 16-bit value (board >> 16*y) & 0xFFFF
+and the leftmost cell of a row is its lowest nibble.
+Since a nibble holds at most 15, the largest tile that can be represented is 2**15 (32768).
+
+Moves are resolved with lookup tables over all 65,536 packed rows, built once when the module is imported.
+Up and down moves reuse the left and right tables on the rows of the transposed board.
+"""
+
+MAX_BOARD_DIMENSION = 4
+MAX_EXPONENT = 15
+ROW_MASK = 0xFFFF
+CELL_MASK = 0xF
+
+def tileToExponent(tile: int) -> int:
+    """
+    This converts a tile value to its 4-bit exponent.
+
+    :param tile: The tile value, 0 for a blank cell.
+    :type tile: int
+    :return: The tile exponent, 0 for a blank cell.
+    :rtype: int
+    """
+    if tile == 0: return 0
+    return min(tile.bit_length() - 1, MAX_EXPONENT)
+
+def exponentToTile(exponent: int) -> int:
+    """
+    This converts a 4-bit exponent back to its tile value.
+
+    :param exponent: The tile exponent, 0 for a blank cell.
+    :type exponent: int
+    :return: The tile value, 0 for a blank cell.
+    :rtype: int
+    """
+    if exponent == 0: return 0
+    return 1 << exponent
+
+def packBoard(board: list) -> int:
+    """
+    This packs a 4x4 list board into a single 64-bit integer.
+
+    :param board: The given 4x4 2048 board.
+    :type board: list
+    :return: The packed board.
+    :rtype: int
+    """
+    packed = 0
+    shift = 0
+    for row in board:
+        for tile in row:
+            packed |= tileToExponent(tile) << shift
+            shift += 4
+    return packed
+
+def unpackBoard(packed: int) -> list:
+    """
+    This unpacks a 64-bit packed board back into a 4x4 list board.
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: The 4x4 2048 board.
+    :rtype: list
+    """
+    board = []
+    for y in range(MAX_BOARD_DIMENSION):
+        row = []
+        for x in range(MAX_BOARD_DIMENSION):
+            row.append(exponentToTile((packed >> (16*y + 4*x)) & CELL_MASK))
+        board.append(row)
+    return board
+
+def getExponent(packed: int, y: int, x: int) -> int:
+    """
+    This gets the exponent stored in one cell of the packed board.
+
+    :param packed: The packed board.
+    :type packed: int
+    :param y: The row index.
+    :type y: int
+    :param x: The column index.
+    :type x: int
+    :return: The cell exponent, 0 for a blank cell.
+    :rtype: int
+    """
+    return (packed >> (16*y + 4*x)) & CELL_MASK
+
+def setExponent(packed: int, y: int, x: int, exponent: int) -> int:
+    """
+    This returns a new packed board with one cell set to the given exponent.
+
+    :param packed: The packed board.
+    :type packed: int
+    :param y: The row index.
+    :type y: int
+    :param x: The column index.
+    :type x: int
+    :param exponent: The new cell exponent, 0 for a blank cell.
+    :type exponent: int
+    :return: The updated packed board.
+    :rtype: int
+    """
+    shift = 16*y + 4*x
+    return (packed & ~(CELL_MASK << shift)) | (exponent << shift)
+
+def getOpenCells(packed: int) -> list:
+    """
+    This finds all cells that are empty in the packed board.
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: A list of all open cells as (y, x) tuples.
+    :rtype: list
+    """
+    open_cells = []
+    for i in range(16):
+        if (packed >> (4*i)) & CELL_MASK == 0:
+            open_cells.append((i >> 2, i & 3))
+    return open_cells
+
+def countOpenCells(packed: int) -> int:
+    """
+    This counts the empty cells in the packed board.
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: The number of open cells.
+    :rtype: int
+    """
+    # Collapse every nibble to its lowest bit, then the popcount of the inverse is the number of blank cells
+    packed |= packed >> 2
+    packed |= packed >> 1
+    return 16 - (packed & 0x1111111111111111).bit_count()
+
+def getOpenCellMask(packed: int) -> int:
+    """
+    This gets a 16-bit mask of the empty cells in the packed board, bit 4*y + x for cell (y, x).
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: The open cell mask.
+    :rtype: int
+    """
+    return (
+        ROW_EMPTY_MASK[packed & ROW_MASK] | ROW_EMPTY_MASK[(packed >> 16) & ROW_MASK] << 4 |
+        ROW_EMPTY_MASK[(packed >> 32) & ROW_MASK] << 8 | ROW_EMPTY_MASK[packed >> 48] << 12
+    )
+
+def transpose(packed: int) -> int:
+    """
+    This transposes the packed board, swapping the cells (y, x) and (x, y).
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: The transposed packed board.
+    :rtype: int
+    """
+    a1 = packed & 0xF0F00F0FF0F00F0F
+    a2 = packed & 0x0000F0F00000F0F0
+    a3 = packed & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def hasPotentialMerges(packed: int) -> bool:
+    """
+    This checks if any two neighboring cells hold the same tile.
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: True if the board can merge cells, False otherwise.
+    :rtype: bool
+    """
+    for board in (packed, transpose(packed)):
+        for y in range(MAX_BOARD_DIMENSION):
+            row = (board >> (16*y)) & ROW_MASK
+            for x in range(MAX_BOARD_DIMENSION - 1):
+                if (row >> (4*x)) & CELL_MASK == (row >> (4*x + 4)) & CELL_MASK: return True
+    return False
+
+def countDistinctTiles(packed: int) -> int:
+    """
+    This counts the distinct tile values on the packed board.
+
+    :param packed: The packed board.
+    :type packed: int
+    :return: The number of distinct tile values, blank cells are not counted.
+    :rtype: int
+    """
+    seen = 0
+    while packed:
+        seen |= 1 << (packed & CELL_MASK)
+        packed >>= 4
+    return (seen >> 1).bit_count()
+
+def mergeRowExponents(row_values: list) -> tuple:
+    """
+    This merges and combines exponents from right to right for a single row.\n
+    It start are the right and merges values in the right direction.\n
+    Two equal exponents e merge into e + 1, which scores the new tile 2**(e + 1).\n
+
+    :param row_values: The row list of tile exponents to combine.
+    :type row_values: list
+    :return: The updated row list of tile exponents after the being merged and the score gained.
+    :rtype: tuple
+    """
+    row_values = [exponent for exponent in row_values if exponent != 0]
+    final_values = []
+    score = 0
+    i = len(row_values) - 1
+    while i >= 0:
+        if i - 1 >= 0 and row_values[i] == row_values[i-1] and row_values[i] < MAX_EXPONENT:
+            new_exponent = row_values[i] + 1
+            final_values.append(new_exponent)
+            score += 1 << new_exponent
+            i -= 2
+        else:
+            final_values.append(row_values[i])
+            i -= 1
+
+    while len(final_values) < MAX_BOARD_DIMENSION:
+        final_values.append(0)
+    return final_values[::-1], score
+
+def buildRowTables() -> tuple:
+    """
+    This builds the left and right move tables for every possible packed row.
+
+    :return: The rows after a left move, the rows after a right move, the score gained by either move,
+             and whether a left or right move changes the row.
+    :rtype: tuple
+    """
+    row_left = [0] * (ROW_MASK + 1)
+    row_right = [0] * (ROW_MASK + 1)
+    row_score = [0] * (ROW_MASK + 1)
+    row_changed_left = [False] * (ROW_MASK + 1)
+    row_changed_right = [False] * (ROW_MASK + 1)
+    for row in range(ROW_MASK + 1):
+        row_values = [(row >> (4*x)) & CELL_MASK for x in range(MAX_BOARD_DIMENSION)]
+        right_values, score = mergeRowExponents(row_values)
+        left_values, _ = mergeRowExponents(row_values[::-1]) # Row in reverse order (going left)
+        left_values = left_values[::-1]
+        left = right = 0
+        for x in range(MAX_BOARD_DIMENSION):
+            left |= left_values[x] << (4*x)
+            right |= right_values[x] << (4*x)
+        row_left[row] = left
+        row_right[row] = right
+        row_score[row] = score # A run of equal tiles merges the same pairs in either direction
+        row_changed_left[row] = left != row
+        row_changed_right[row] = right != row
+    return row_left, row_right, row_score, row_changed_left, row_changed_right
+
+ROW_LEFT, ROW_RIGHT, ROW_SCORE, ROW_CHANGED_LEFT, ROW_CHANGED_RIGHT = buildRowTables()
+
+def buildRowMetadataTables() -> tuple:
+    """
+    This builds the metadata tables for every possible packed row, used to keep the game state up to date in O(1).
+
+    :return: The 4-bit mask of the blank cells, the highest exponent,
+             and whether two neighboring tiles in the row are equal.
+    :rtype: tuple
+    """
+    row_empty_mask = [0] * (ROW_MASK + 1)
+    row_max_exponent = [0] * (ROW_MASK + 1)
+    row_has_merge = [False] * (ROW_MASK + 1)
+    for row in range(ROW_MASK + 1):
+        row_values = [(row >> (4*x)) & CELL_MASK for x in range(MAX_BOARD_DIMENSION)]
+        for x in range(MAX_BOARD_DIMENSION):
+            if row_values[x] == 0: row_empty_mask[row] |= 1 << x
+            if x > 0 and row_values[x] != 0 and row_values[x] == row_values[x-1]: row_has_merge[row] = True
+        row_max_exponent[row] = max(row_values)
+    return row_empty_mask, row_max_exponent, row_has_merge
+
+ROW_EMPTY_MASK, ROW_MAX_EXPONENT, ROW_HAS_MERGE = buildRowMetadataTables()
+
+ROW_HEURISTIC_TABLES = {} # Snake heuristic weights -> its 4 per-row score tables, built on first use
+
+def buildRowHeuristicTable(row_weights: list) -> list:
+    """
+    This builds the snake heuristic score of one board row for every possible packed row.
+
+    :param row_weights: The 4 snake heuristic weights of the row.
+    :type row_weights: list
+    :return: The weighted tile sum of every packed row.
+    :rtype: list
+    """
+    cell_scores = [[0] + [weight << exponent for exponent in range(1, MAX_EXPONENT + 1)] for weight in row_weights]
+    scores_0, scores_1, scores_2, scores_3 = cell_scores
+    table = []
+    for score_3 in scores_3:
+        for score_2 in scores_2:
+            partial = score_3 + score_2
+            for score_1 in scores_1:
+                partial_1 = partial + score_1
+                table.extend([partial_1 + score_0 for score_0 in scores_0])
+    return table
+
+def getRowHeuristicTables(snake_heuristic: list) -> list:
+    """
+    This gets the per-row score tables of a snake heuristic, building them the first time they are needed.
+    The snake score of a board is then the sum of 4 lookups, one per row.
+
+    :param snake_heuristic: The 4x4 snake heuristic weights.
+    :type snake_heuristic: list
+    :return: The score tables of rows 0 to 3.
+    :rtype: list
+    """
+    key = tuple(tuple(row_weights) for row_weights in snake_heuristic)
+    tables = ROW_HEURISTIC_TABLES.get(key)
+    if tables is None:
+        tables = [buildRowHeuristicTable(row_weights) for row_weights in snake_heuristic]
+        ROW_HEURISTIC_TABLES[key] = tables
+    return tables
+
+def scoreBoard(packed: int, tables: list) -> int:
+    """
+    This gets the heuristic score of the packed board, the sum of one lookup per row into the row score tables.
+
+    :param packed: The packed board.
+    :type packed: int
+    :param tables: The score tables of rows 0 to 3, see getRowHeuristicTables.
+    :type tables: list
+    :return: The heuristic score.
+    :rtype: int
+    """
+    table_0, table_1, table_2, table_3 = tables
+    return table_0[packed & ROW_MASK] + table_1[(packed >> 16) & ROW_MASK] + table_2[(packed >> 32) & ROW_MASK] + table_3[packed >> 48]
@@ -0,0 +1,101 @@
+"""
+This holds the single move kernel shared by the game model, the Expectiminimax searcher and the MCTS simulator.
+
+Every function works on packed 64-bit boards (see bitboard.py) and resolves each row with one table lookup.
+Directions use the same integers as model.Direction: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+"""
+
+from bitboard import transpose, ROW_MASK, ROW_LEFT, ROW_RIGHT, ROW_SCORE, ROW_CHANGED_LEFT, ROW_CHANGED_RIGHT
+
+DIRECTION_UP = 1
+DIRECTION_DOWN = 2
+DIRECTION_LEFT = 3
+DIRECTION_RIGHT = 4
+DIRECTIONS = (DIRECTION_UP, DIRECTION_DOWN, DIRECTION_LEFT, DIRECTION_RIGHT)
+
+def move(board: int, direction: int) -> tuple:
+    """
+    This shifts the tiles of the given packed board in one of the 4 cardinal directions.
+
+    :param board: The given packed 2048 board.
+    :type board: int
+    :param direction: The direction to shift the board tiles.
+    :type direction: int
+    :return: The shifted packed board, the score gained by the merges, and True if the board changed.
+    :rtype: tuple
+    """
+    if direction == DIRECTION_UP or direction == DIRECTION_DOWN:
+        rows = transpose(board)
+    elif direction == DIRECTION_LEFT or direction == DIRECTION_RIGHT:
+        rows = board
+    else:
+        return board, 0, False # Invalid direction
+
+    row_0 = rows & ROW_MASK
+    row_1 = (rows >> 16) & ROW_MASK
+    row_2 = (rows >> 32) & ROW_MASK
+    row_3 = (rows >> 48) & ROW_MASK
+    row_table = ROW_LEFT if direction == DIRECTION_UP or direction == DIRECTION_LEFT else ROW_RIGHT
+    final_board = row_table[row_0] | row_table[row_1] << 16 | row_table[row_2] << 32 | row_table[row_3] << 48
+    if rows is not board: final_board = transpose(final_board)
+    score = ROW_SCORE[row_0] + ROW_SCORE[row_1] + ROW_SCORE[row_2] + ROW_SCORE[row_3]
+    return final_board, score, final_board != board
+
+def shiftBoard(board: int, direction: int) -> int:
+    """
+    This shifts the tiles of the given packed board without tracking the score, for the search hot loops.
+
+    :param board: The given packed 2048 board.
+    :type board: int
+    :param direction: The direction to shift the board tiles.
+    :type direction: int
+    :return: The shifted packed board, which equals the given board if no tiles changed positions.
+    :rtype: int
+    """
+    if direction == DIRECTION_LEFT:
+        return (
+            ROW_LEFT[board & ROW_MASK] | ROW_LEFT[(board >> 16) & ROW_MASK] << 16 |
+            ROW_LEFT[(board >> 32) & ROW_MASK] << 32 | ROW_LEFT[(board >> 48) & ROW_MASK] << 48
+        )
+    if direction == DIRECTION_RIGHT:
+        return (
+            ROW_RIGHT[board & ROW_MASK] | ROW_RIGHT[(board >> 16) & ROW_MASK] << 16 |
+            ROW_RIGHT[(board >> 32) & ROW_MASK] << 32 | ROW_RIGHT[(board >> 48) & ROW_MASK] << 48
+        )
+    if direction == DIRECTION_UP or direction == DIRECTION_DOWN:
+        row_table = ROW_LEFT if direction == DIRECTION_UP else ROW_RIGHT
+        rows = transpose(board)
+        return transpose(
+            row_table[rows & ROW_MASK] | row_table[(rows >> 16) & ROW_MASK] << 16 |
+            row_table[(rows >> 32) & ROW_MASK] << 32 | row_table[(rows >> 48) & ROW_MASK] << 48
+        )
+    return board # Invalid direction
+
+def canMove(board: int, direction: int) -> bool:
+    """
+    This checks if shifting the given packed board changes it, using the row change tables instead of a trial shift.
+
+    :param board: The given packed 2048 board.
+    :type board: int
+    :param direction: The direction to shift the board tiles.
+    :type direction: int
+    :return: True if the tiles on the board would change positions, False otherwise.
+    :rtype: bool
+    """
+    if direction == DIRECTION_UP or direction == DIRECTION_DOWN: board = transpose(board)
+    row_changed = ROW_CHANGED_LEFT if direction == DIRECTION_UP or direction == DIRECTION_LEFT else ROW_CHANGED_RIGHT
+    return (
+        row_changed[board & ROW_MASK] or row_changed[(board >> 16) & ROW_MASK] or
+        row_changed[(board >> 32) & ROW_MASK] or row_changed[(board >> 48) & ROW_MASK]
+    )
+
+def getLegalDirections(board: int) -> list:
+    """
+    This gets every direction that changes the given packed board.
+
+    :param board: The given packed 2048 board.
+    :type board: int
+    :return: The legal directions in UP, DOWN, LEFT, RIGHT order.
+    :rtype: list
+    """
+    return [direction for direction in DIRECTIONS if canMove(board, direction)]
@@ -1,15 +1,83 @@
 from model import Model2048, Direction
+from bitboard import packBoard, getOpenCells, countOpenCells, countDistinctTiles, hasPotentialMerges, setExponent, getRowHeuristicTables, buildRowHeuristicTable, scoreBoard
+from engine import shiftBoard, DIRECTIONS
+from transposition import TranspositionTable
+from concurrent.futures import ProcessPoolExecutor
 import math as m
+import time
+
+class SearchTimeout(Exception):
+    """
+    This is raised inside the search once the per-move deadline has passed, to abandon the current iteration.
+    """
+
+class DepthPolicy:
+    """
+    This class picks the Expectiminimax search depth for each move from how crowded the board is.
+    Open boards early in the game get a shallow search and crowded endgame boards get a deep one.
+    """
+
+    def __init__(self, min_depth: int = 3, max_depth: int = 7, open_cell_thresholds: tuple = (6, 3), distinct_tile_thresholds: tuple = (7, 9)):
+        """
+        This sets up the depth thresholds.
+        
+        :param min_depth: The search depth of an open board.
+        :type min_depth: int
+        :param max_depth: The deepest search depth allowed.
+        :type max_depth: int
+        :param open_cell_thresholds: Each threshold the open cell count is at or below adds 1 to the depth.
+        :type open_cell_thresholds: tuple
+        :param distinct_tile_thresholds: Each threshold the distinct tile value count is at or above adds 1 to the depth.
+        :type distinct_tile_thresholds: tuple
+        """
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.open_cell_thresholds = open_cell_thresholds
+        self.distinct_tile_thresholds = distinct_tile_thresholds
+
+    def getDepth(self, board: int) -> int:
+        """
+        This gets the search depth for the given board.
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :return: The search depth.
+        :rtype: int
+        """
+        num_open_cells = countOpenCells(board)
+        num_distinct_tiles = countDistinctTiles(board)
+        depth = self.min_depth
+        for threshold in self.open_cell_thresholds:
+            if num_open_cells <= threshold: depth += 1
+        for threshold in self.distinct_tile_thresholds:
+            if num_distinct_tiles >= threshold: depth += 1
+        return min(depth, self.max_depth)
+
+    def getThresholds(self) -> dict:
+        """
+        This gets the configured depth thresholds, for the move statistics.
+        
+        :return: The min and max depth and the open cell and distinct tile thresholds.
+        :rtype: dict
+        """
+        return {
+            "min_depth": self.min_depth,
+            "max_depth": self.max_depth,
+            "open_cell_thresholds": self.open_cell_thresholds,
+            "distinct_tile_thresholds": self.distinct_tile_thresholds,
+        }
 
 class Expectiminimax2048():
     """
     This class uses the Expectiminimax algorithm to determine the "best" next move in 2048.
+    The search runs on packed 64-bit boards, see bitboard.py.
     """
 
     MAX_BOARD_DIMENSION = 4
     BLANK_TILE = 0
     TILE_2_CHANCE = 0.9
     TILE_4_CHANCE = 0.1
+    MAX_ITERATIVE_DEPTH = 20
     SNAKE_HEURISTIC_1 = [
         [2**15, 2**14, 2**13, 2**12],
         [2**8, 2**9, 2**10, 2**11],
@@ -35,7 +103,8 @@ class Expectiminimax2048():
         [4**0, 4**1, 4**2, 4**3]
     ]
 
-    def __init__(self, depth: int, snake: int):
+    def __init__(self, depth: int, snake: int, cache_size: int = 0, probability_cutoff: float = 0.0, depth_policy: DepthPolicy = None, workers: int = 0, pruning: bool = False,
+                 sample_limit: int = 0, sample_size: int = 6, sample_seed: int = 0, persistent_cache: bool = False):
         """
         This sets up the variables needed for Expectiminimax to function.
         
@@ -43,239 +112,552 @@ class Expectiminimax2048():
         :type depth: int
         :param snake: Which snake heuristic to use.
         :type snake: int
-        
+        :param cache_size: The max number of transposition table entries, 0 disables the table.
+        :type cache_size: int
+        :param probability_cutoff: Chance paths less likely than this are scored with the heuristic instead of searched, 0 disables it.
+        :type probability_cutoff: float
+        :param depth_policy: Picks the search depth per move from the board, None always searches to the fixed depth.
+        :type depth_policy: DepthPolicy
+        :param workers: The number of worker processes the root moves and their tile spawns are split across, 0 searches in this process.
+        :type workers: int
+        :param pruning: If Star1 cutoffs prune chance nodes that can no longer beat a better move. This picks the same move as the
+                        unpruned search at the same depth, so the probability cutoff is not applied while pruning.
+        :type pruning: bool
+        :param sample_limit: Chance nodes with more open cells than this only search a stratified sample of them, 0 disables it.
+        :type sample_limit: int
+        :param sample_size: The number of open cells searched at a sampled chance node.
+        :type sample_size: int
+        :param sample_seed: The seed of the cell samples, the same board and seed always sample the same cells.
+        :type sample_seed: int
+        :param persistent_cache: If the transposition table is kept across moves, each move a new generation, instead of cleared.
+                                 Call clearCache between games.
+        :type persistent_cache: bool
         """
         self.depth = depth # How deep are algorithm will search
         self.snake = snake # If the heuristic will be the snake 1
+        self.heuristic_tables = getRowHeuristicTables(self.getSnakeHeuristic())
+        self.table = TranspositionTable(cache_size) if cache_size > 0 else None
+        self.probability_cutoff = probability_cutoff
+        self.depth_policy = depth_policy
+        self.workers = workers
+        self.pool = None # Created on the first parallel search and kept for every later move and game
+        self.pruning = pruning
+        self.max_heuristic_weight = max(max(row_weights) for row_weights in self.getSnakeHeuristic())
+        self.tile_sum_table = buildRowHeuristicTable([1, 1, 1, 1]) if pruning else None # Weights of 1 sum the tiles of a row
+        self.sample_limit = sample_limit
+        self.sample_size = sample_size
+        self.sample_seed = sample_seed
+        self.persistent_cache = persistent_cache
+        self.search_id = 0    # Sent with every worker task, a new id starts a new generation or clears the worker tables
+        self.cache_clears = 0 # Sent with every worker task, a new count clears the worker tables like clearCache
+        self.nodes = 0
+        self.pruned = 0
+        self.cutoffs = 0
+        self.children_skipped = 0
+        self.sampled = 0
+        self.deadline = None
+        self.stats = {}
 
-    def getHeuristicScore(self, board: list) -> int:
+    def getSnakeHeuristic(self) -> list:
         """
-        This gets the board's heuristic score.
+        This gets the snake heuristic weights selected by the snake setting.
         
-        :param board: The given 4x4 2048 board.
-        :type board: list
-        :return: The heuristic score.
-        :rtype: int
+        :return: The 4x4 snake heuristic weights.
+        :rtype: list
         """
         match self.snake:
             case 1:
-                return self.__getHeuristicSnakeScore(board, self.SNAKE_HEURISTIC_1)
+                return self.SNAKE_HEURISTIC_1
             case 2:
-                return self.__getHeuristicSnakeScore(board, self.SNAKE_HEURISTIC_2)
+                return self.SNAKE_HEURISTIC_2
             case 3:
-                return self.__getHeuristicSnakeScore(board, self.SNAKE_HEURISTIC_3)
+                return self.SNAKE_HEURISTIC_3
             case 4:
-                return self.__getHeuristicSnakeScore(board, self.SNAKE_HEURISTIC_4)
+                return self.SNAKE_HEURISTIC_4
             case _:
-                return self.__getHeuristicSnakeScore(board, self.SNAKE_HEURISTIC_2)
+                return self.SNAKE_HEURISTIC_2
 
-    def __getHeuristicSnakeScore(self, board: list, snake_heuristic: list) -> int:
+    def getHeuristicScore(self, board: int) -> int:
         """
-        This gets the board snake heuristic score.
-                
-        :param b: The given 4x4 2048 board.
-        :type b: list
-        :param h: The snake heuristic to be used when getting the board's score.
-        :type h: list
+        This gets the board's snake heuristic score.
+        The score is a sum of independent per-row terms, so it is 4 lookups into the precomputed row score tables.
+        
+        :param board: The given packed 2048 board.
+        :type board: int
         :return: The heuristic score.
         :rtype: int
         """
-        br0, br1, br2, br3 = board              # Board rows
-        hr0, hr1, hr2, hr3 = snake_heuristic    # Snake heuristic rows
-        return (
-            br0[0]*hr0[0] + br0[1]*hr0[1] + br0[2]*hr0[2] + br0[3]*hr0[3] +
-            br1[0]*hr1[0] + br1[1]*hr1[1] + br1[2]*hr1[2] + br1[3]*hr1[3] +
-            br2[0]*hr2[0] + br2[1]*hr2[1] + br2[2]*hr2[2] + br2[3]*hr2[3] +
-            br3[0]*hr3[0] + br3[1]*hr3[1] + br3[2]*hr3[2] + br3[3]*hr3[3]
-        )
+        return scoreBoard(board, self.heuristic_tables)
 
-    def getNextDirection(self, board: list) -> int:
+    def getNextDirection(self, board: list, time_budget_ms: float = None) -> int:
         """
         This returns the "best" direction to shift the tiles in the given board.
         
         :param board: The given 4x4 2048 board.
         :type board: list
+        :param time_budget_ms: The per-move time budget for an iterative deepening search, None searches to the fixed depth.
+        :type time_budget_ms: float
         :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
         :rtype: int
         """
-        best_direction = Direction.UP
+        return self.getNextDirectionPacked(packBoard(board), time_budget_ms)
+
+    def getNextDirectionPacked(self, board: int, time_budget_ms: float = None, max_depth: int = None) -> int:
+        """
+        This returns the "best" direction to shift the tiles in the given packed board.\n
+        With a time budget, depths 1, 2, 3, ... are searched until the deadline passes,
+        and the move of the deepest search that finished is returned.
+        Each iteration searches the previous best move first, which only saves work with pruning, where a better
+        first move raises alpha for the others. The entries of a shallower iteration are too shallow to answer the
+        lookups of a deeper one, so the transposition table does not carry work from one iteration to the next.\n
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param time_budget_ms: The per-move time budget for an iterative deepening search,
+                               None searches to the fixed depth or the depth policy's depth.
+        :type time_budget_ms: float
+        :param max_depth: The deepest iteration of a timed search, e.g, self.depth for a fixed-depth search that can be cut short.
+                          None deepens up to MAX_ITERATIVE_DEPTH.
+        :type max_depth: int
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        start_time = time.perf_counter()
+        self.search_id += 1
+        self.nodes = 0
+        self.pruned = 0
+        self.cutoffs = 0
+        self.children_skipped = 0
+        self.sampled = 0
+        if self.table:
+            if self.persistent_cache:
+                self.table.newGeneration()
+            else:
+                self.table.clear()
+            self.table.resetStats() # The hit rates are per move
+
+        if time_budget_ms is None:
+            depth = self.depth_policy.getDepth(board) if self.depth_policy else self.depth
+            if self.workers > 0 and depth > 1:
+                best_direction = self.__getBestRootDirectionParallel(board, depth)
+            else:
+                best_direction = self.__getBestRootDirection(board, depth, DIRECTIONS)
+        else:
+            depth = 1
+            best_direction = self.__getBestRootDirection(board, depth, DIRECTIONS) # Always finishes, so there is a move
+            self.deadline = start_time + time_budget_ms / 1000
+            try:
+                while depth < (max_depth if max_depth is not None else self.MAX_ITERATIVE_DEPTH):
+                    ordered_directions = (best_direction,) + tuple(d for d in DIRECTIONS if d != best_direction)
+                    best_direction = self.__getBestRootDirection(board, depth + 1, ordered_directions)
+                    depth += 1
+            except SearchTimeout:
+                pass # The unfinished iteration is thrown away
+            finally:
+                self.deadline = None
+
+        self.stats = {
+            "depth": depth,
+            "nodes": self.nodes,
+            "pruned": self.pruned,
+            "time_ms": (time.perf_counter() - start_time) * 1000,
+            "time_budget_ms": time_budget_ms,
+        }
+        if self.sample_limit: self.stats["sampled"] = self.sampled
+        if self.pruning:
+            self.stats["cutoffs"] = self.cutoffs
+            self.stats["children_skipped"] = self.children_skipped
+        if self.depth_policy: self.stats["depth_policy"] = self.depth_policy.getThresholds()
+        if self.table: self.stats["cache"] = self.table.getStats()
+        return best_direction
+
+    def __getBestRootDirection(self, board: int, depth: int, directions: tuple) -> int:
+        """
+        This searches every legal direction from the root board to the given depth.
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param depth: The search depth.
+        :type depth: int
+        :param directions: The directions in the order they are searched, ties go to the earliest one.
+        :type directions: tuple
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        best_direction = Direction.UP.value
         highest_heuristic = 0
-        original_board = [row[:] for row in board]
-        for direction in Direction:
-            board_copy = [row[:] for row in board]
-            board_changed = self.__shift(board_copy, original_board, direction.value)
-            if board_changed:
-                heuristic = self.__getBestScore(board_copy, self.depth - 1, False)
+        for direction in directions:
+            board_copy = shiftBoard(board, direction)
+            if board_copy != board:
+                if self.pruning:
+                    heuristic = self.__getBoundedScore(board_copy, depth - 1, False, highest_heuristic)
+                else:
+                    heuristic = self.__getBestScore(board_copy, depth - 1, False, 1.0)
                 if heuristic > highest_heuristic:
                     highest_heuristic = heuristic
                     best_direction = direction
-        return best_direction.value
+        return best_direction
 
-    def __getBestScore(self, board: list, current_depth: int, players_turn: bool) -> int:
+    def __getBestRootDirectionParallel(self, board: int, depth: int) -> int:
         """
-        Returns the best heuristic score for the given board and depth.
+        This searches every legal direction from the root board to the given depth on the worker pool.
+        Each (direction, open cell, tile) spawn below the root is one task, 
+        and the results are combined in the same order as the serial search, so both pick the same direction.
         
-        :param board: The current board.
-        :type board: list
-        :param current_depth: The current search depth.
-        :type current_depth: int
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param depth: The search depth, at least 2. Star1 pruning is not applied to the split search.
+        :type depth: int
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=initWorker,
+                initargs=(
+                    self.depth, self.snake, self.table.max_entries if self.table else 0, self.probability_cutoff,
+                    self.sample_limit, self.sample_size, self.sample_seed, self.persistent_cache
+                )
+            )
+
+        moves = []
+        tasks = []
+        for direction in DIRECTIONS:
+            board_copy = shiftBoard(board, direction)
+            if board_copy != board:
+                open_cells = self.__sampleOpenCells(board_copy, getOpenCells(board_copy)) # A legal move always leaves an open cell
+                moves.append((direction, len(open_cells)))
+                probability_2 = self.TILE_2_CHANCE / len(open_cells)
+                probability_4 = self.TILE_4_CHANCE / len(open_cells)
+                for y, x in open_cells:
+                    tasks.append((setExponent(board_copy, y, x, 1), depth - 2, probability_2, self.search_id, self.cache_clears))
+                    tasks.append((setExponent(board_copy, y, x, 2), depth - 2, probability_4, self.search_id, self.cache_clears))
+        results = iter(self.pool.map(searchSpawnWorker, tasks, chunksize=max(1, len(tasks) // (4 * self.workers))))
+
+        best_direction = Direction.UP.value
+        highest_heuristic = 0
+        for direction, num_open_cells in moves:
+            self.nodes += 1 # The chance node below the root move
+            sum_heuristic_2 = 0
+            sum_heuristic_4 = 0
+            for _ in range(num_open_cells):
+                heuristic_2, counters_2 = next(results)
+                heuristic_4, counters_4 = next(results)
+                sum_heuristic_2 += heuristic_2
+                sum_heuristic_4 += heuristic_4
+                self.__addWorkerCounters(counters_2)
+                self.__addWorkerCounters(counters_4)
+            avg_heuristic_2 = sum_heuristic_2 / num_open_cells
+            avg_heuristic_4 = sum_heuristic_4 / num_open_cells
+            heuristic = m.floor(avg_heuristic_2 * self.TILE_2_CHANCE + avg_heuristic_4 * self.TILE_4_CHANCE)
+            if heuristic > highest_heuristic:
+                highest_heuristic = heuristic
+                best_direction = direction
+        return best_direction
+
+    def getBoardScore(self, board: int, depth: int, players_turn: bool, probability: float = 1.0) -> int:
+        """
+        This searches a single board to the given depth without resetting the statistics or the transposition table.
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param depth: The remaining search depth.
+        :type depth: int
         :param players_turn: If it is the player's turn, shifting tiles.
         :type players_turn: bool
-        :return: The average heuristic score of the board overall.
+        :param probability: The product of the tile spawn probabilities on the path to this board.
+        :type probability: float
+        :return: The heuristic score of the board.
         :rtype: int
         """
-        if current_depth == 0: return self.getHeuristicScore(board)
- 
-        open_cells = self.__getAllOpenCells(board)
-        num_open_cells = len(open_cells)
-        if num_open_cells == 0 and not self.__potentialMerges(board): return self.getHeuristicScore(board)
-
-        if players_turn: # Player's Turn: Tiles shift
-            highest_heuristic = 0
-            original_board = [row[:] for row in board]
-            for direction in Direction:
-                board_copy = [row[:] for row in board]
-                board_changed = self.__shift(board_copy, original_board, direction.value)
-                if board_changed:
-                    heuristic = self.__getBestScore(board_copy, current_depth - 1, False)
-                    if heuristic > highest_heuristic: highest_heuristic = heuristic
-            return highest_heuristic
-        else: # Game's Turn: Random tile spawn
-            if num_open_cells != 0:
-                sum_heuristic_2 = 0
-                sum_heuristic_4 = 0
-                for cell in open_cells:
-                    board_copy_2 = [row[:] for row in board]
-                    board_copy_4 = [row[:] for row in board]
-                    y, x = cell
-                    board_copy_2[y][x] = 2
-                    board_copy_4[y][x] = 4
-                    sum_heuristic_2 += self.__getBestScore(board_copy_2, current_depth - 1, True)
-                    sum_heuristic_4 += self.__getBestScore(board_copy_4, current_depth - 1, True)
+        return self.__getBestScore(board, depth, players_turn, probability)
 
-                avg_heuristic_2 = sum_heuristic_2 / num_open_cells
-                avg_heuristic_4 = sum_heuristic_4 / num_open_cells
-                return m.floor(avg_heuristic_2 * self.TILE_2_CHANCE + avg_heuristic_4 * self.TILE_4_CHANCE)
-            else:
-                board_copy = [row[:] for row in board]
-                return self.__getBestScore(board_copy, current_depth - 1, True)
+    def clearCache(self):
+        """
+        This removes every transposition table entry, e.g, between games with a persistent cache.
+        """
+        if self.table: self.table.clear()
+        self.cache_clears += 1 # The worker tables are cleared with their next task
 
-    def __getAllOpenCells(self, board: list) -> list:
+    def close(self):
         """
-        This finds all cells that are empty in the given board.
-        
-        :param board: The given 4x4 2048 board.
-        :type board: list
-        :return: A list of all open cells.
-        :rtype: list
+        This shuts down the worker pool, if one was started.
         """
-        open_cells = []
-        for y in range(self.MAX_BOARD_DIMENSION):
-            for x in range(self.MAX_BOARD_DIMENSION):
-                if board[y][x] == self.BLANK_TILE:
-                    open_cells.append((y, x))
-        return open_cells
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
-    def __potentialMerges(self, board: list) -> bool:
+    def getStats(self) -> dict:
+        """
+        This gets the statistics of the last search, e.g, the nodes searched and the transposition table hits.
+        
+        :return: The last search statistics.
+        :rtype: dict
         """
-        This checks if any cells can be merged together.
+        return self.stats
 
-        :param board: The current 4x4 2048 board to check.
-        :type board: list
-        :return: True if the board can merge cells, False otherwise.
-        :rtype: bool
+    def __addWorkerCounters(self, counters: tuple):
+        """
+        This adds the counters of one worker task to the statistics of this search.
+        
+        :param counters: The nodes searched, pruned and sampled, and the transposition table counters or None without a table.
+        :type counters: tuple
         """
-        for i in range(self.MAX_BOARD_DIMENSION):
-            for j in range(self.MAX_BOARD_DIMENSION - 1):
-                if board[i][j] == board[i][j+1] or board[j][i] == board[j+1][i]: return True
-        return False
+        nodes, pruned, sampled, table_counters = counters
+        self.nodes += nodes
+        self.pruned += pruned
+        self.sampled += sampled
+        if self.table and table_counters: self.table.addStats(*table_counters)
 
-    def __gameOver(self, board: list) -> bool:
+    def __getBestScore(self, board: int, current_depth: int, players_turn: bool, probability: float) -> int:
         """
-        This gets if the game is over, i.e, no tiles can merge into each other.
+        Returns the best heuristic score for the given board and depth.
         
-        :param board: The current 4x4 2048 board to check.
-        :type board: list
-        :return: True if the board can't progress any more, False otherwise.
-        :rtype: bool
+        :param board: The current packed board.
+        :type board: int
+        :param current_depth: The current search depth.
+        :type current_depth: int
+        :param players_turn: If it is the player's turn, shifting tiles.
+        :type players_turn: bool
+        :param probability: The product of the tile spawn probabilities on the path to this board.
+        :type probability: float
+        :return: The average heuristic score of the board overall.
+        :rtype: int
         """
-        for y in range(self.MAX_BOARD_DIMENSION):
-            for x in range(self.MAX_BOARD_DIMENSION):
-                if board[y][x] == self.BLANK_TILE: return False
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline: raise SearchTimeout()
+        if current_depth == 0: return self.getHeuristicScore(board)
+
+        table = self.table
+        if table:
+            key = board << 1 | players_turn # The same board is a different node on the player's and the game's turn
+            cached_heuristic = table.get(key, current_depth)
+            if cached_heuristic is not None: return cached_heuristic
+
+        if probability < self.probability_cutoff: # Too unlikely to be worth searching, and too path dependent to cache
+            self.pruned += 1
+            return self.getHeuristicScore(board)
+ 
+        open_cells = getOpenCells(board)
+        num_open_cells = len(open_cells)
+        if num_open_cells == 0 and not hasPotentialMerges(board):
+            heuristic = self.getHeuristicScore(board)
+        elif players_turn: # Player's Turn: Tiles shift
+            heuristic = 0
+            for direction in DIRECTIONS:
+                board_copy = shiftBoard(board, direction)
+                if board_copy != board:
+                    child_heuristic = self.__getBestScore(board_copy, current_depth - 1, False, probability)
+                    if child_heuristic > heuristic: heuristic = child_heuristic
+        elif num_open_cells != 0: # Game's Turn: Random tile spawn
+            open_cells = self.__sampleOpenCells(board, open_cells)
+            num_open_cells = len(open_cells) # A sample is averaged over its own cells
+            sum_heuristic_2 = 0
+            sum_heuristic_4 = 0
+            probability_2 = probability * self.TILE_2_CHANCE / num_open_cells
+            probability_4 = probability * self.TILE_4_CHANCE / num_open_cells
+            for cell in open_cells:
+                y, x = cell
+                sum_heuristic_2 += self.__getBestScore(setExponent(board, y, x, 1), current_depth - 1, True, probability_2)
+                sum_heuristic_4 += self.__getBestScore(setExponent(board, y, x, 2), current_depth - 1, True, probability_4)
+
+            avg_heuristic_2 = sum_heuristic_2 / num_open_cells
+            avg_heuristic_4 = sum_heuristic_4 / num_open_cells
+            heuristic = m.floor(avg_heuristic_2 * self.TILE_2_CHANCE + avg_heuristic_4 * self.TILE_4_CHANCE)
+        else:
+            heuristic = self.__getBestScore(board, current_depth - 1, True, probability)
 
-        return not self.__potentialMerges(board)
+        if table: table.put(key, current_depth, heuristic)
+        return heuristic
 
-    def __shift(self, board: list, original_board: list, direction: int) -> list:
+    def __getBoundedScore(self, board: int, current_depth: int, players_turn: bool, alpha: float) -> int:
         """
-        This shifts the tiles of the given board in one of the 4 cardinal directions.
+        Returns the best heuristic score for the given board and depth, pruned with Star1 cutoffs.\n
+        The snake heuristic of any board below this one is at most the largest snake weight times the tile sum,
+        and every tile spawn adds at most 4 to the tile sum. Once the spawns searched so far plus that upper bound
+        for the rest cannot beat alpha, the remaining spawns of a chance node are skipped.\n
         
-        :param board: The given 4x4 2048 board to shift.
-        :type board: list
-        :param original_board: The original 4x4 2048 board before the shift.
-        :type original_board: list
-        :param direction: The direction to shift the board tiles. 
-        :type direction: int
-        :return: True if the tiles on the board have changed positions, False otherwise.
-        :rtype: list
+        :param board: The current packed board.
+        :type board: int
+        :param current_depth: The current search depth.
+        :type current_depth: int
+        :param players_turn: If it is the player's turn, shifting tiles.
+        :type players_turn: bool
+        :param alpha: The score a better move elsewhere already guarantees.
+        :type alpha: float
+        :return: The exact score if it is above alpha, otherwise a score at or below alpha.
+        :rtype: int
         """
-        if direction == Direction.UP.value:
-            for col in range(self.MAX_BOARD_DIMENSION):
-                original_col_values = [row[col] for row in board][::-1] # Column in reverse order (going up)
-                final_col_values = self.__merge(original_col_values)[::-1]
-                for row in range(self.MAX_BOARD_DIMENSION):
-                    board[row][col] = final_col_values[row]
-        elif direction == Direction.DOWN.value:
-            for col in range(self.MAX_BOARD_DIMENSION):
-                original_col_values = [row[col] for row in board] # Column in normal order (going down)
-                final_col_values = self.__merge(original_col_values)
-                for row in range(self.MAX_BOARD_DIMENSION):
-                    board[row][col] = final_col_values[row]
-        elif direction == Direction.LEFT.value:
-            for row in range(self.MAX_BOARD_DIMENSION):
-                original_row_values = board[row][::-1] # Row in reverse order
-                final_row_values = self.__merge(original_row_values)[::-1]
-                board[row] = final_row_values
-        elif direction == Direction.RIGHT.value:
-            for row in range(self.MAX_BOARD_DIMENSION):
-                original_row_values = board[row] # Row in normal order
-                final_row_values = self.__merge(original_row_values)
-                board[row] = final_row_values
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline: raise SearchTimeout()
+        if current_depth == 0: return self.getHeuristicScore(board)
+
+        table = self.table
+        if table:
+            key = board << 1 | players_turn # The same board is a different node on the player's and the game's turn
+            cached_heuristic = table.get(key, current_depth, alpha)
+            if cached_heuristic is not None: return cached_heuristic
+ 
+        open_cells = getOpenCells(board)
+        num_open_cells = len(open_cells)
+        exact = True
+        if num_open_cells == 0 and not hasPotentialMerges(board):
+            heuristic = self.getHeuristicScore(board)
+        elif players_turn: # Player's Turn: Tiles shift
+            heuristic = 0
+            for direction in DIRECTIONS:
+                board_copy = shiftBoard(board, direction)
+                if board_copy != board:
+                    child_heuristic = self.__getBoundedScore(board_copy, current_depth - 1, False, max(alpha, heuristic))
+                    if child_heuristic > heuristic: heuristic = child_heuristic
+            exact = heuristic > alpha # Otherwise the children may only be bounds
+        elif num_open_cells != 0: # Game's Turn: Random tile spawn
+            open_cells = self.__sampleOpenCells(board, open_cells)
+            num_open_cells = len(open_cells) # A sample is averaged over its own cells
+            table_sum = self.tile_sum_table
+            tile_sum = table_sum[board & 0xFFFF] + table_sum[(board >> 16) & 0xFFFF] + table_sum[(board >> 32) & 0xFFFF] + table_sum[board >> 48]
+            upper_bound = self.max_heuristic_weight * (tile_sum + 4 * ((current_depth + 1) // 2))
+            weight_2 = self.TILE_2_CHANCE / num_open_cells
+            weight_4 = self.TILE_4_CHANCE / num_open_cells
+            sum_heuristic_2 = 0
+            sum_heuristic_4 = 0
+            searched_total = 0.0    # The weighted scores of the spawns searched so far
+            remaining_weight = 1.0  # The weight of the spawns not searched yet
+            num_children = 2 * num_open_cells
+            for cell in open_cells:
+                y, x = cell
+                for exponent, weight in ((1, weight_2), (2, weight_4)):
+                    remaining_weight -= weight
+                    num_children -= 1
+                    # The child score at or below which this node cannot beat alpha, less a margin for float rounding
+                    child_alpha = (alpha - searched_total - remaining_weight * upper_bound) / weight
+                    child_alpha -= 1 + abs(child_alpha) * 1e-9
+                    child_heuristic = self.__getBoundedScore(setExponent(board, y, x, exponent), current_depth - 1, True, child_alpha)
+                    if child_heuristic <= child_alpha:
+                        exact = False
+                        break
+                    searched_total += weight * child_heuristic
+                    if exponent == 1:
+                        sum_heuristic_2 += child_heuristic
+                    else:
+                        sum_heuristic_4 += child_heuristic
+                if not exact: break
+
+            if exact:
+                avg_heuristic_2 = sum_heuristic_2 / num_open_cells
+                avg_heuristic_4 = sum_heuristic_4 / num_open_cells
+                heuristic = m.floor(avg_heuristic_2 * self.TILE_2_CHANCE + avg_heuristic_4 * self.TILE_4_CHANCE)
+            else:
+                self.cutoffs += 1
+                self.children_skipped += num_children
+                heuristic = m.floor(alpha)
         else:
-            return False # Invalid direction
+            heuristic = self.__getBoundedScore(board, current_depth - 1, True, alpha)
+            exact = heuristic > alpha
 
-        return original_board != board
+        if table:
+            if exact:
+                table.put(key, current_depth, heuristic)
+            else: # The score is only known to be at or below alpha, and it is an integer
+                table.put(key, current_depth, m.floor(alpha), True)
+        return heuristic
 
-    def __merge(self, list_values: list) -> list:
+    def __sampleOpenCells(self, board: int, open_cells: list) -> list:
         """
-        This merges and combines numbers from right to right for a single row/column.\n
-        It start are the right and merges values in the right direction.\n
+        This picks the open cells a chance node searches. Above the sample limit, it is a stratified sample of sample_size cells:
+        the open cells are split into equal strata and one cell is taken from each, rotated by an offset hashed from the board.
+        A uniform sample of cells averages to the same expected score as all of them.
         
-        :param list_values: The row/column list of values to combine.
-        :type list_values: list
-        :return: The updated row/column list of values after the being merged.
+        :param board: The current packed board.
+        :type board: int
+        :param open_cells: All open cells of the board.
+        :type open_cells: list
+        :return: The open cells to search.
         :rtype: list
         """
-        list_values = [tile for tile in list_values if tile != self.BLANK_TILE]
-        final_values = []
-        i = len(list_values) - 1
-        while i >= 0:
-            if i - 1 >= 0 and list_values[i] == list_values[i-1]:
-                new_tile = list_values[i] * 2
-                final_values.append(new_tile)
-                i -= 2
+        num_open_cells = len(open_cells)
+        if not self.sample_limit or num_open_cells <= self.sample_limit or num_open_cells <= self.sample_size: return open_cells
+
+        self.sampled += 1
+        offset = ((((board ^ self.sample_seed) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 40) % num_open_cells
+        stratum_size = num_open_cells / self.sample_size
+        return [open_cells[(offset + int(i * stratum_size)) % num_open_cells] for i in range(self.sample_size)]
+
+worker_expectiminimax = None # The searcher of a worker process in the pool
+
+worker_search_id = None # The search the worker's last task belonged to
+worker_cache_clears = 0 # The clearCache calls the worker's table has seen
+
+def initWorker(depth: int, snake: int, cache_size: int, probability_cutoff: float, sample_limit: int, sample_size: int, sample_seed: int,
+               persistent_cache: bool):
+    """
+    This creates the searcher a worker process keeps for every task it runs.
+    
+    :param depth: The search depth of the AI solver/search.
+    :type depth: int
+    :param snake: Which snake heuristic to use.
+    :type snake: int
+    :param cache_size: The max number of transposition table entries, 0 disables the table.
+    :type cache_size: int
+    :param probability_cutoff: Chance paths less likely than this are scored with the heuristic instead of searched.
+    :type probability_cutoff: float
+    :param sample_limit: Chance nodes with more open cells than this only search a sample of them.
+    :type sample_limit: int
+    :param sample_size: The number of open cells searched at a sampled chance node.
+    :type sample_size: int
+    :param sample_seed: The seed of the cell samples.
+    :type sample_seed: int
+    :param persistent_cache: If the worker's transposition table is kept across searches, each search a new generation, instead of cleared.
+    :type persistent_cache: bool
+    """
+    global worker_expectiminimax
+    worker_expectiminimax = Expectiminimax2048(
+        depth, snake, cache_size, probability_cutoff, sample_limit=sample_limit, sample_size=sample_size, sample_seed=sample_seed,
+        persistent_cache=persistent_cache
+    )
+
+def searchSpawnWorker(task: tuple) -> tuple:
+    """
+    This searches one spawned board below a root move in a worker process.
+    The first task of a new search starts a new generation of the worker's table, or clears it without a persistent cache,
+    and the first task after clearCache clears it.
+    
+    :param task: The spawned packed board, its remaining depth, its path probability, the search id and the cache generation.
+    :type task: tuple
+    :return: The board's heuristic score and the counters of the task: the nodes searched, pruned and sampled,
+             and the transposition table hits, previous hits, misses and evictions or None without a table.
+    :rtype: tuple
+    """
+    global worker_search_id, worker_cache_clears
+    board, depth, probability, search_id, cache_clears = task
+    expectiminimax = worker_expectiminimax
+    table = expectiminimax.table
+    table_counters = None
+    if table:
+        if cache_clears != worker_cache_clears:
+            table.clear()
+        elif search_id != worker_search_id:
+            if expectiminimax.persistent_cache:
+                table.newGeneration()
             else:
-                final_values.append(list_values[i])
-                i -= 1
+                table.clear()
+        table.resetStats()
+    worker_search_id = search_id
+    worker_cache_clears = cache_clears
 
-        while len(final_values) < self.MAX_BOARD_DIMENSION:
-            final_values.append(0)
-        return final_values[::-1]
+    expectiminimax.nodes = 0
+    expectiminimax.pruned = 0
+    expectiminimax.sampled = 0
+    heuristic = expectiminimax.getBoardScore(board, depth, True, probability)
+    if table: table_counters = (table.hits, table.previous_hits, table.misses, table.evictions)
+    return heuristic, (expectiminimax.nodes, expectiminimax.pruned, expectiminimax.sampled, table_counters)
 
 def main():
     model = Model2048()
     expectiminimax = Expectiminimax2048(5, False) # Search depth of 5 is a good balance
     while not model.gameOver():
-        direction = expectiminimax.getNextDirection(model.getBoard())
+        direction = expectiminimax.getNextDirectionPacked(model.getPackedBoard())
         board_changed = model.shift(direction)
         if board_changed:
             model.addTile()
@@ -0,0 +1,271 @@
+from array import array
+import math as m
+import random as r
+from bitboard import getOpenCellMask
+from engine import shiftBoard, canMove, DIRECTIONS
+
+class MCTSTree:
+    """
+    This class stores a whole MCTS tree as a struct of arrays instead of one MCTSNode object per node.
+    A node is an index into the preallocated arrays, its children are a linked list from first_child through next_sibling,
+    and the untried actions are a bitmask: bit direction - 1 on the player's turn and bit 4*y + x of an open cell on the game's turn.
+    Released nodes go on a free list and are handed out again before the arrays grow.
+    """
+
+    TILE_2_CHANCE = 0.9
+    TILE_4_CHANCE = 0.1
+    NO_NODE = -1
+
+    def __init__(self, capacity: int = 4096):
+        """
+        This preallocates the node arrays.
+
+        :param capacity: The number of nodes allocated up front, the arrays double in size when they run out.
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self.parent = array("i", [self.NO_NODE]) * capacity
+        self.first_child = array("i", [self.NO_NODE]) * capacity
+        self.next_sibling = array("i", [self.NO_NODE]) * capacity
+        self.action = array("b", [0]) * capacity       # The direction on a player's child, the spawned cell on a game's child
+        self.untried = array("H", [0]) * capacity      # The actions not expanded yet
+        self.players_turn = array("b", [0]) * capacity
+        self.visits = array("q", [0]) * capacity
+        self.reward = array("d", [0.0]) * capacity
+        self.board = array("Q", [0]) * capacity
+        self.size = 0       # Nodes handed out from the end of the arrays
+        self.free = []      # Released nodes
+        self.num_nodes = 0  # Nodes currently in the tree
+
+    def clear(self):
+        """
+        This releases every node without freeing the arrays.
+        """
+        self.size = 0
+        self.free.clear()
+        self.num_nodes = 0
+
+    def addNode(self, board: int, parent: int, action: int, players_turn: bool) -> int:
+        """
+        This allocates a node and appends it to its parent's children.
+
+        :param board: The packed 2048 board of the node.
+        :type board: int
+        :param parent: The parent node, NO_NODE for a root.
+        :type parent: int
+        :param action: The direction or spawned cell that leads from the parent to this node.
+        :type action: int
+        :param players_turn: If it is the player's turn to shift tiles in the node.
+        :type players_turn: bool
+        :return: The new node.
+        :rtype: int
+        """
+        if self.free:
+            node = self.free.pop()
+        else:
+            if self.size == self.capacity: self.__grow()
+            node = self.size
+            self.size += 1
+        self.num_nodes += 1
+
+        if players_turn:
+            untried = 0
+            for direction in DIRECTIONS:
+                if canMove(board, direction): untried |= 1 << (direction - 1)
+        else:
+            untried = getOpenCellMask(board)
+
+        self.parent[node] = parent
+        self.first_child[node] = self.NO_NODE
+        self.next_sibling[node] = self.NO_NODE
+        self.action[node] = action
+        self.untried[node] = untried
+        self.players_turn[node] = players_turn
+        self.visits[node] = 0
+        self.reward[node] = 0.0
+        self.board[node] = board
+
+        if parent != self.NO_NODE: # Appended last, so children keep their expansion order
+            child = self.first_child[parent]
+            if child == self.NO_NODE:
+                self.first_child[parent] = node
+            else:
+                while self.next_sibling[child] != self.NO_NODE: child = self.next_sibling[child]
+                self.next_sibling[child] = node
+        return node
+
+    def releaseSubtree(self, node: int):
+        """
+        This returns the node and all of its descendants to the free list.
+
+        :param node: The root of the subtree to release.
+        :type node: int
+        """
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            child = first_child[node]
+            while child != self.NO_NODE:
+                stack.append(child)
+                child = next_sibling[child]
+            self.free.append(node)
+            self.num_nodes -= 1
+
+    def promoteToRoot(self, node: int, root: int):
+        """
+        This makes the node the root of the tree and releases every other node under the old root.
+
+        :param node: The new root, a descendant of the old root.
+        :type node: int
+        :param root: The old root.
+        :type root: int
+        """
+        parent = self.parent[node]
+        child = self.first_child[parent]
+        if child == node: # Unlinked from its parent's children, so it survives releasing the old root
+            self.first_child[parent] = self.next_sibling[node]
+        else:
+            while self.next_sibling[child] != node: child = self.next_sibling[child]
+            self.next_sibling[child] = self.next_sibling[node]
+        self.parent[node] = self.NO_NODE
+        self.next_sibling[node] = self.NO_NODE
+        self.releaseSubtree(root)
+
+    def isGameOver(self, node: int) -> bool:
+        """
+        This checks if the node has no actions at all, i.e, the game is over.
+
+        :param node: The node.
+        :type node: int
+        :return: True if the node has no untried actions and no children.
+        :rtype: bool
+        """
+        return self.untried[node] == 0 and self.first_child[node] == self.NO_NODE
+
+    def getChildren(self, node: int) -> list:
+        """
+        This gets the children of the node in expansion order.
+
+        :param node: The node.
+        :type node: int
+        :return: The child nodes.
+        :rtype: list
+        """
+        children = []
+        child = self.first_child[node]
+        while child != self.NO_NODE:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def selectBestChild(self, node: int, C: float) -> int:
+        """
+        Given the node, the child with the best UCB1 score is returned, with the same UCB1 score as MCTSNode.
+
+        :param node: The node, which must have children.
+        :type node: int
+        :param C: The exploration constant used to adjust weighting.
+        :type C: float
+        :return: The child with the best UCB1 score.
+        :rtype: int
+        """
+        visits = self.visits
+        reward = self.reward
+        next_sibling = self.next_sibling
+        log_parent_visits = m.log(visits[node])
+        best_child = self.NO_NODE
+        best_child_ucb1 = float("-inf")
+        child = self.first_child[node]
+        while child != self.NO_NODE:
+            child_visits = visits[child]
+            exploit = m.tanh(m.log(reward[child] / child_visits) / 70)
+            child_ucb1 = exploit + C * m.sqrt(log_parent_visits / child_visits)
+            if child_ucb1 > best_child_ucb1:
+                best_child_ucb1 = child_ucb1
+                best_child = child
+            child = next_sibling[child]
+        return best_child
+
+    def expandNode(self, node: int) -> int:
+        """
+        Given the node, this adds a child for its last untried action, like MCTSNode.expandNode.
+
+        :param node: The node, which must have an untried action.
+        :type node: int
+        :return: The new child.
+        :rtype: int
+        """
+        untried = self.untried[node]
+        index = untried.bit_length() - 1
+        self.untried[node] = untried ^ (1 << index)
+        board = self.board[node]
+        if self.players_turn[node]:
+            direction = index + 1
+            return self.addNode(shiftBoard(board, direction), node, direction, False)
+        exponent = 1 if r.random() < self.TILE_2_CHANCE else 2
+        return self.addNode(board | (exponent << (4*index)), node, index, True)
+
+    def sampleOutcome(self, node: int, widening_constant: float, widening_exponent: float) -> tuple:
+        """
+        Given the tile spawn node, this samples a (cell, tile) outcome by its probability and returns its child, like MCTSNode.sampleOutcome.
+        The child's action is 2*cell for a 2 tile and 2*cell + 1 for a 4 tile, and the open cells are never removed from untried.
+
+        :param node: The tile spawn node.
+        :type node: int
+        :param widening_constant: The constant of the progressive widening limit.
+        :type widening_constant: float
+        :param widening_exponent: The exponent of the progressive widening limit.
+        :type widening_exponent: float
+        :return: The child node and True if it was just created.
+        :rtype: tuple
+        """
+        open_cells = self.untried[node]
+        for _ in range(r.randrange(open_cells.bit_count())): open_cells &= open_cells - 1 # Drops the lowest open cells
+        cell = (open_cells & -open_cells).bit_length() - 1
+        exponent = 1 if r.random() < self.TILE_2_CHANCE else 2
+        outcome = 2*cell + exponent - 1
+
+        children = self.getChildren(node)
+        for child in children:
+            if self.action[child] == outcome: return child, False
+
+        if len(children) < widening_constant * (self.visits[node] + 1) ** widening_exponent:
+            return self.addNode(self.board[node] | (exponent << (4*cell)), node, outcome, True), True
+
+        weights = [self.TILE_4_CHANCE if self.action[child] & 1 else self.TILE_2_CHANCE for child in children]
+        return r.choices(children, weights)[0], False
+
+    def backPropagation(self, node: int, reward: float):
+        """
+        Given the node, this updates the reward and visits of itself, its parent, its parent's parent, and so on.
+
+        :param node: The node.
+        :type node: int
+        :param reward: The heuristic score to add to each node's reward.
+        :type reward: float
+        """
+        parent = self.parent
+        visits = self.visits
+        rewards = self.reward
+        while node != self.NO_NODE:
+            visits[node] += 1
+            rewards[node] += reward
+            node = parent[node]
+
+    def __grow(self):
+        """
+        This doubles the capacity of every node array.
+        """
+        capacity = self.capacity
+        self.parent.extend(array("i", [self.NO_NODE]) * capacity)
+        self.first_child.extend(array("i", [self.NO_NODE]) * capacity)
+        self.next_sibling.extend(array("i", [self.NO_NODE]) * capacity)
+        self.action.extend(array("b", [0]) * capacity)
+        self.untried.extend(array("H", [0]) * capacity)
+        self.players_turn.extend(array("b", [0]) * capacity)
+        self.visits.extend(array("q", [0]) * capacity)
+        self.reward.extend(array("d", [0.0]) * capacity)
+        self.board.extend(array("Q", [0]) * capacity)
+        self.capacity *= 2
@@ -1,5 +1,7 @@
 from enum import Enum
 import random as r
+from bitboard import unpackBoard, setExponent, getExponent, transpose, ROW_MASK, ROW_EMPTY_MASK, ROW_MAX_EXPONENT, ROW_HAS_MERGE
+from engine import move
 
 class Direction(Enum):
     """
@@ -13,6 +15,9 @@ class Direction(Enum):
 class Model2048:
     """
     This holds the functions to setup, run, and play the game 2048.
+    The board is stored as a packed 64-bit integer of tile exponents, see bitboard.py.
+    The empty-cell mask, tile count, highest exponent and whether neighboring tiles can merge are kept up to date
+    as tiles spawn and shift, so the game over, open cell and highest tile queries never rescan the board.
     """
 
     MAX_BOARD_DIMENSION = 4
@@ -24,18 +29,39 @@ class Model2048:
         """
         This initializes the 2048 game with a zero scores and a board with two, random 2 or 4, tiles.
         """
-        self.board = [
-            [0, 0, 0, 0],
-            [0, 0, 0, 0],
-            [0, 0, 0, 0],
-            [0, 0, 0, 0]
-        ]
+        self.board = 0
         self.score = 0
         self.best_score = 0
         self.game_over = False
+        self.__resetMetadata()
         self.addTile()
         self.addTile()
 
+    def __resetMetadata(self):
+        """
+        This sets the board metadata for an empty board.
+        """
+        self.empty_mask = 0xFFFF        # Bit 4*y + x is set if cell (y, x) is blank
+        self.tile_count = 0
+        self.max_exponent = 0
+        self.has_merge = False          # If two neighboring tiles are equal
+
+    def __updateMetadata(self):
+        """
+        This rebuilds the board metadata after a shift with 8 row table lookups.
+        """
+        board = self.board
+        columns = transpose(board)
+        row_0, row_1, row_2, row_3 = board & ROW_MASK, (board >> 16) & ROW_MASK, (board >> 32) & ROW_MASK, board >> 48
+        col_0, col_1, col_2, col_3 = columns & ROW_MASK, (columns >> 16) & ROW_MASK, (columns >> 32) & ROW_MASK, columns >> 48
+        self.empty_mask = ROW_EMPTY_MASK[row_0] | ROW_EMPTY_MASK[row_1] << 4 | ROW_EMPTY_MASK[row_2] << 8 | ROW_EMPTY_MASK[row_3] << 12
+        self.tile_count = 16 - self.empty_mask.bit_count()
+        self.max_exponent = max(ROW_MAX_EXPONENT[row_0], ROW_MAX_EXPONENT[row_1], ROW_MAX_EXPONENT[row_2], ROW_MAX_EXPONENT[row_3])
+        self.has_merge = (
+            ROW_HAS_MERGE[row_0] or ROW_HAS_MERGE[row_1] or ROW_HAS_MERGE[row_2] or ROW_HAS_MERGE[row_3] or
+            ROW_HAS_MERGE[col_0] or ROW_HAS_MERGE[col_1] or ROW_HAS_MERGE[col_2] or ROW_HAS_MERGE[col_3]
+        )
+
     def getAllOpenCells(self) -> list:
         """
         This finds all cells that are empty. They all have a value of 0.
@@ -44,10 +70,11 @@ class Model2048:
         :rtype: list
         """
         open_cells = []
-        for y in range(self.MAX_BOARD_DIMENSION):
-            for x in range(self.MAX_BOARD_DIMENSION):
-                if self.board[y][x] == self.BLANK_TILE:
-                    open_cells.append((y, x))
+        empty_mask = self.empty_mask
+        while empty_mask:
+            cell = (empty_mask & -empty_mask).bit_length() - 1
+            open_cells.append((cell >> 2, cell & 3))
+            empty_mask &= empty_mask - 1
         return open_cells
 
     def addTile(self) -> bool:
@@ -57,14 +84,26 @@ class Model2048:
         :return: True if a new cell was added, False otherwise.
         :rtype: bool
         """
-        open_cells = self.getAllOpenCells()
-        if open_cells:
-            y, x = r.choice(open_cells)
+        if self.empty_mask:
+            empty_mask = self.empty_mask
+            for _ in range(r.randrange(16 - self.tile_count)): # Same draw as r.choice(open_cells)
+                empty_mask &= empty_mask - 1
+            cell = (empty_mask & -empty_mask).bit_length() - 1
+            y, x = cell >> 2, cell & 3
             tile_probability_num = r.random()
-            if tile_probability_num < self.TILE_2_CHANCE:
-                self.board[y][x] = 2
-            else:
-                self.board[y][x] = 4
+            exponent = 1 if tile_probability_num < self.TILE_2_CHANCE else 2
+            self.board = setExponent(self.board, y, x, exponent)
+
+            self.empty_mask ^= 1 << cell
+            self.tile_count += 1
+            if exponent > self.max_exponent: self.max_exponent = exponent
+            if not self.has_merge:
+                self.has_merge = (
+                    (y > 0 and getExponent(self.board, y - 1, x) == exponent) or
+                    (y < self.MAX_BOARD_DIMENSION - 1 and getExponent(self.board, y + 1, x) == exponent) or
+                    (x > 0 and getExponent(self.board, y, x - 1) == exponent) or
+                    (x < self.MAX_BOARD_DIMENSION - 1 and getExponent(self.board, y, x + 1) == exponent)
+                )
             return True
         return False
     
@@ -72,47 +111,7 @@ class Model2048:
         """
         This checks if the game is over, i.e, no tiles can merge into each other.
         """
-        for y in range(self.MAX_BOARD_DIMENSION):
-            for x in range(self.MAX_BOARD_DIMENSION):
-                if self.board[y][x] == self.BLANK_TILE:
-                    self.game_over = False
-                    return
-
-        for i in range(self.MAX_BOARD_DIMENSION):
-            for j in range(self.MAX_BOARD_DIMENSION - 1):
-                if self.board[i][j] == self.board[i][j+1] or self.board[j][i] == self.board[j+1][i]:
-                    self.game_over = False
-                    return
-
-        self.game_over = True
-
-    def merge(self, list_values: list) -> list:
-        """
-        This merges and combines numbers from right to right for a single row/column.\n
-        It start are the right and merges values in the right direction.\n
-        
-        :param list_values: The row/column list of values to combine.
-        :type list_values: list
-        :return: The updated row/column list of values after the being merged.
-        :rtype: list
-        """
-        list_values = [tile for tile in list_values if tile != self.BLANK_TILE]
-        final_values = []
-        i = len(list_values) - 1
-        while i >= 0:
-            if i - 1 >= 0 and list_values[i] == list_values[i-1]:
-                new_tile = list_values[i] * 2
-                final_values.append(new_tile)
-                self.score += new_tile
-                if self.score > self.best_score: self.best_score = self.score
-                i -= 2
-            else:
-                final_values.append(list_values[i])
-                i -= 1
-
-        while len(final_values) < self.MAX_BOARD_DIMENSION:
-            final_values.append(0)
-        return final_values[::-1]
+        self.game_over = self.empty_mask == 0 and not self.has_merge
 
     def shift(self, direction: int) -> bool:
         """
@@ -124,34 +123,12 @@ class Model2048:
         :rtype: bool
         """
         if self.game_over: return False
-        original_board = [row[:] for row in self.board]
-
-        if direction == Direction.UP.value:
-            for col in range(self.MAX_BOARD_DIMENSION):
-                original_col_values = [row[col] for row in self.board][::-1] # Column in reverse order (going up)
-                final_col_values = self.merge(original_col_values)[::-1]
-                for row in range(self.MAX_BOARD_DIMENSION):
-                    self.board[row][col] = final_col_values[row]
-        elif direction == Direction.DOWN.value:
-            for col in range(self.MAX_BOARD_DIMENSION):
-                original_col_values = [row[col] for row in self.board] # Column in normal order (going down)
-                final_col_values = self.merge(original_col_values)
-                for row in range(self.MAX_BOARD_DIMENSION):
-                    self.board[row][col] = final_col_values[row]
-        elif direction == Direction.LEFT.value:
-            for row in range(self.MAX_BOARD_DIMENSION):
-                original_row_values = self.board[row][::-1] # Row in reverse order
-                final_row_values = self.merge(original_row_values)[::-1]
-                self.board[row] = final_row_values
-        elif direction == Direction.RIGHT.value:
-            for row in range(self.MAX_BOARD_DIMENSION):
-                original_row_values = self.board[row] # Row in normal order
-                final_row_values = self.merge(original_row_values)
-                self.board[row] = final_row_values
-        else:
-            return False # Invalid direction
-
-        return original_board != self.board
+        final_board, score, board_changed = move(self.board, direction)
+        self.board = final_board
+        if board_changed: self.__updateMetadata()
+        self.score += score
+        if self.score > self.best_score: self.best_score = self.score
+        return board_changed
 
     def playAction(self, direction: int):
         """
@@ -173,6 +150,15 @@ class Model2048:
         :return: The 4x4 game board.
         :rtype: list
         """
+        return unpackBoard(self.board)
+
+    def getPackedBoard(self) -> int:
+        """
+        This gets the current 2048 game board in its packed 64-bit form.
+        
+        :return: The packed game board.
+        :rtype: int
+        """
         return self.board
 
     def getScore(self) -> int:
@@ -209,26 +195,16 @@ class Model2048:
         :return: The highest tile.
         :rtype: int
         """
-        highest_tile = 2
-        for y in range(self.MAX_BOARD_DIMENSION):
-            for x in range(self.MAX_BOARD_DIMENSION):
-                tile = self.board[y][x]
-                if tile > highest_tile:
-                    highest_tile = tile
-        return highest_tile
+        return max(2, 1 << self.max_exponent)
 
     def restart(self):
         """
         This restarts the 2048 game with a zero scores and a board with two, random 2 or 4, tiles.
         """
-        self.board = [
-            [0, 0, 0, 0],
-            [0, 0, 0, 0],
-            [0, 0, 0, 0],
-            [0, 0, 0, 0],
-        ]
+        self.board = 0
         self.score = 0
         self.game_over = False
+        self.__resetMetadata()
         self.addTile()
         self.addTile()
 
@@ -238,9 +214,10 @@ class Model2048:
         """
         print("----------------------------------------")
         print(f"Score: {self.score}")
+        board = unpackBoard(self.board)
         for y in range(self.MAX_BOARD_DIMENSION):
             for x in range(self.MAX_BOARD_DIMENSION):
-                print(f"{self.board[y][x]}  ", end='')
+                print(f"{board[y][x]}  ", end='')
             print(" ")
         
     def playActionCLI(self, direction: int):
@@ -1,11 +1,17 @@
 from model import Direction
+from bitboard import packBoard, getOpenCells, setExponent, getRowHeuristicTables, scoreBoard
+from engine import move, shiftBoard, getLegalDirections, DIRECTIONS
 import math as m
 import random as r
+import time
 from expectiminimax import Expectiminimax2048
+from mctstree import MCTSTree
+from concurrent.futures import ProcessPoolExecutor
 
 class MCTSNode:
     """
     This class represents the games nodes used by MonteCarlo2048 to simulate a state of 2048.
+    Each node holds its board as a packed 64-bit integer, see bitboard.py.
     """
 
     MAX_BOARD_DIMENSION = 4
@@ -36,14 +42,15 @@ class MCTSNode:
         [4**6, 4**5, 4**4, 4**3],
         [4**0, 4**1, 4**2, 4**3]
     ]
+    HEURISTIC_TABLES = getRowHeuristicTables(SNAKE_HEURISTIC_3) # The row score tables of SNAKE_HEURISTIC_3
 
-    def __init__(self, board: list, parent: "MCTSNode", direction: int, players_turn: bool):
+    def __init__(self, board: int, parent: "MCTSNode", direction: int, players_turn: bool):
         """
         This creates the MCTS 2048 Node with all of the relevant information. 
-        All and available action are set and the state is checked if the game is over.  
+        The actions and whether the game is over are generated on first use, most nodes are simulated once and never expanded.
         
-        :param board: The given current 4x4 2048 board.
-        :type board: list
+        :param board: The given current packed 2048 board.
+        :type board: int
         :param parent: The parent node of the current MCTS2048Node.
         :type parent: "MCTSNode"
         :param direction: The shift direction made to reach this state: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT, None: Random tile.
@@ -56,44 +63,46 @@ class MCTSNode:
         self.direction = direction
         self.players_turn = players_turn
         self.children = []
-        self.all_actions = []
-        self.available_actions = []
-        self.game_over = True
+        self.actions = None         # The untried actions, None until generated
+        self.shifted_boards = None  # direction -> shifted board of the legal moves, kept from the trial shifts for expandNode
+        self.outcome_children = None # (cell, exponent) -> child of a spawn node that samples its outcomes
+        self.edge_visits = None      # child -> visits through the edge to it, only when children are shared between parents
         self.visits = 0
         self.reward = 0.0
 
-        open_cells = []
-        for y in range(self.MAX_BOARD_DIMENSION):
-            for x in range(self.MAX_BOARD_DIMENSION):
-                if board[y][x] == self.BLANK_TILE: open_cells.append((y, x))
-
-        if len(open_cells) > 0:
-            self.game_over = False
-            if players_turn:
-                for direction in Direction:
-                    board_copy = [row[:] for row in board]
-                    board_changed = self.__shift(board_copy, board, direction.value)
-                    if board_changed: self.all_actions.append(direction.value)
-            else:
-                self.all_actions = open_cells
-        elif players_turn:
-            check1 = False
-            check2 = False
-            for i in range(self.MAX_BOARD_DIMENSION):
-                for j in range(self.MAX_BOARD_DIMENSION - 1):
-                    if board[i][j] == board[i][j+1] and not check1:
-                        self.all_actions.append(Direction.RIGHT.value)
-                        self.all_actions.append(Direction.LEFT.value)
-                        self.game_over = False
-                        check1 = True
-                    
-                    if board[j][i] == board[j+1][i] and not check2:
-                        self.all_actions.append(Direction.DOWN.value)
-                        self.all_actions.append(Direction.UP.value)
-                        self.game_over = False
-                        check2 = True
-
-        self.available_actions = self.all_actions
+    @property
+    def available_actions(self) -> list:
+        """
+        The actions not expanded yet: the legal directions on the player's turn and the open cells on the game's turn.
+        
+        :rtype: list
+        """
+        if self.actions is None: self.__generateActions()
+        return self.actions
+
+    @property
+    def game_over(self) -> bool:
+        """
+        True if the node has no actions at all, i.e, the game is over.
+        
+        :rtype: bool
+        """
+        if self.actions is None: self.__generateActions()
+        return len(self.actions) == 0 and len(self.children) == 0
+
+    def __generateActions(self):
+        """
+        This generates the node's actions. The player's legal directions come from trial shifts, whose boards are kept for the children.
+        """
+        board = self.board
+        if self.players_turn:
+            self.shifted_boards = {}
+            for direction in DIRECTIONS:
+                board_copy = shiftBoard(board, direction)
+                if board_copy != board: self.shifted_boards[direction] = board_copy
+            self.actions = list(self.shifted_boards)
+        else:
+            self.actions = getOpenCells(board)
 
     def selectBestChild(self, C: float) -> "MCTSNode":
         """
@@ -104,83 +113,114 @@ class MCTSNode:
         """
         best_child = None
         best_child_ucb1 = float("-inf")
+        edge_visits = self.edge_visits
         for child in self.children:
-            child_ucb1 = self.__UCB1(child.reward, self.visits, child.visits, C)
+            if edge_visits is None:
+                child_ucb1 = self.__UCB1(child.reward, self.visits, child.visits, C)
+            else: # A shared child: the exploit is its mean over every path, the explore counts only the visits through this edge
+                visits = edge_visits[child]
+                child_ucb1 = self.__UCB1(child.reward / child.visits * visits, self.visits, visits, C)
             if child_ucb1 > best_child_ucb1:
                 best_child_ucb1 = child_ucb1
                 best_child = child
         return best_child
 
-    def expandNode(self) -> "MCTSNode":
+    def expandNode(self, table: dict = None) -> "MCTSNode":
         """
         Given the current node, this adds/creates a new child for it.
         
+        :param table: The nodes of the search by board << 1 | players_turn, to share a child with every parent that reaches its board.
+                      None always creates a new child.
+        :type table: dict
         :return: A new child node for the given parent node based on the parent's available moves.
         :rtype: MCTSNode
         """
         action = self.available_actions.pop()
-        board_copy = [row[:] for row in self.board]
         child = None
         if self.players_turn:
-            board_changed = self.__shift(board_copy, self.board, action)
-            child = MCTSNode(board_copy, self, action, not self.players_turn)
+            child = self.__addChild(self.shifted_boards.pop(action), action, table)
         else:
             y, x  = action
             tile_probability_num = r.random()
             if tile_probability_num < self.TILE_2_CHANCE:
-                board_copy[y][x] = 2
+                board_copy = setExponent(self.board, y, x, 1)
             else:
-                board_copy[y][x] = 4
-            child = MCTSNode(board_copy, self, None, not self.players_turn)
-        self.children.append(child)
+                board_copy = setExponent(self.board, y, x, 2)
+            child = self.__addChild(board_copy, None, table)
+        return child
+
+    def __addChild(self, board: int, direction: int, table: dict) -> "MCTSNode":
+        """
+        This appends a child with the given board, the node of the table with the same board and turn if there is one.
+        
+        :param board: The packed board of the child.
+        :type board: int
+        :param direction: The shift direction made to reach the child, None for a tile spawn.
+        :type direction: int
+        :param table: The nodes of the search by board << 1 | players_turn, None always creates a new child.
+        :type table: dict
+        :return: The child node.
+        :rtype: MCTSNode
+        """
+        if table is None:
+            child = MCTSNode(board, self, direction, not self.players_turn)
+            self.children.append(child)
+            return child
+
+        if self.edge_visits is None: self.edge_visits = {}
+        key = board << 1 | (not self.players_turn)
+        child = table.get(key)
+        if child is None:
+            child = MCTSNode(board, self, direction, not self.players_turn)
+            table[key] = child
+        if child not in self.edge_visits: # Two moves can shift to the same board, the child is only linked once
+            self.edge_visits[child] = 0
+            self.children.append(child)
         return child
 
+    def sampleOutcome(self, widening_constant: float, widening_exponent: float, table: dict = None) -> tuple:
+        """
+        Given the current tile spawn node, this samples a (cell, tile) outcome by its probability and returns its child.
+        An outcome without a child gets one while the node has fewer than widening_constant * (visits + 1)^widening_exponent children,
+        otherwise one of the existing children is sampled by its probability instead.
+        
+        :param widening_constant: The constant of the progressive widening limit.
+        :type widening_constant: float
+        :param widening_exponent: The exponent of the progressive widening limit.
+        :type widening_exponent: float
+        :param table: The nodes of the search by board << 1 | players_turn, to share a child with every parent that reaches its board.
+                      None always creates a new child.
+        :type table: dict
+        :return: The child node and True if it was just created.
+        :rtype: tuple
+        """
+        if self.outcome_children is None: self.outcome_children = {}
+        cell = r.choice(self.available_actions) # The open cells, never popped when the outcomes are sampled
+        exponent = 1 if r.random() < self.TILE_2_CHANCE else 2
+        child = self.outcome_children.get((cell, exponent))
+        if child is not None: return child, False
+
+        if len(self.children) < widening_constant * (self.visits + 1) ** widening_exponent:
+            y, x = cell
+            child = self.__addChild(setExponent(self.board, y, x, exponent), None, table)
+            self.outcome_children[(cell, exponent)] = child
+            return child, True
+
+        outcomes = list(self.outcome_children)
+        weights = [self.TILE_2_CHANCE if outcome_exponent == 1 else self.TILE_4_CHANCE for _, outcome_exponent in outcomes]
+        return self.outcome_children[r.choices(outcomes, weights)[0]], False
+
     def simulateNode(self, expansion_depth: int, expectiminimax) -> int:
         """
         Given the current node, this simulates a game with a max number of turns and return the final board score.
         
         :param expansion_depth: How many turns to simulate in the 2048 game.
         :type expansion_depth: int
-        :param expectiminimax: The model for Expectiminimax which may be None.
+        :param expectiminimax: The model for Expectiminimax, or another rollout policy with getNextDirectionPacked, which may be None.
         :return: The heuristic score of the final board.
         :rtype: int
         """
-        simulation_board = [row[:] for row in self.board]
-        game_over = False
-        i = 0
-        players_turn = self.players_turn
-        while i < expansion_depth and not game_over:
-            if players_turn:
-                if expectiminimax:
-                    direction = expectiminimax.getNextDirection(simulation_board)
-                    board_changed = self.__shift(simulation_board, simulation_board, direction)
-                    if not board_changed and direction == Direction.UP.value: game_over = True
-                else:
-                    directions = [Direction.DOWN.value, Direction.RIGHT.value, Direction.LEFT.value, Direction.UP.value]
-                    board_changed = False
-                    while not board_changed and not game_over:
-                        if len(directions) == 0:
-                            game_over = True
-                            continue
-                        direction = directions.pop(r.randrange(len(directions)))
-                        board_changed = self.__shift(simulation_board, simulation_board, direction)
-            else:
-                open_cells = []
-                for y in range(self.MAX_BOARD_DIMENSION):
-                    for x in range(self.MAX_BOARD_DIMENSION):
-                        if simulation_board[y][x] == self.BLANK_TILE: open_cells.append((y, x))
-
-                if len(open_cells) > 0:
-                    y, x  = r.choice(open_cells)
-                    tile_probability_num = r.random()
-                    if tile_probability_num < self.TILE_2_CHANCE:
-                        simulation_board[y][x] = 2
-                    else:
-                        simulation_board[y][x] = 4
-            players_turn = not players_turn
-            i += 1
-
-        return self.getHeuristicSnakeScore(simulation_board)
+        return simulateBoard(self.board, self.players_turn, expansion_depth, expectiminimax)
 
     def backPropagation(self, reward: int):
         """
@@ -195,6 +235,24 @@ class MCTSNode:
             node.reward += reward
             node = node.parent
     
+    @staticmethod
+    def backPropagatePath(path: list, reward: int):
+        """
+        This updates the score and visits of every node on the selected path, and the visits of the edges between them.
+        Shared children have more than one parent, so the path, not the parent links, says which nodes were visited.
+        
+        :param path: The nodes from the root down to the simulated node.
+        :type path: list
+        :param reward: The heuristic score to add the a nodes reward.
+        :type reward: int
+        """
+        parent = None
+        for node in path:
+            node.visits += 1
+            node.reward += reward
+            if parent is not None: parent.edge_visits[node] += 1
+            parent = node
+
     def __UCB1(self, reward: float, parent_visits: int, node_visits: int, C: float) -> float:
         """
         Given a current node, this returns its Upper Confidence Bound 1 score for trees.
@@ -220,97 +278,132 @@ class MCTSNode:
         #print(f"Exploit: {exploit}, Explore: {explore}")
         return exploit + explore                        # UCB1 typical
 
-    def getHeuristicSnakeScore(self, board: list) -> int:
+    def getHeuristicSnakeScore(self, board: int) -> int:
         """
         Given the current node, this gets its board snake heuristic score.
+        The score is a sum of independent per-row terms, so it is 4 lookups into the precomputed row score tables.
                 
-        :param b: The given 4x4 2048 board.
-        :type b: list
+        :param board: The given packed 2048 board.
+        :type board: int
         :return: The heuristic score.
         :rtype: int
         """
-        br0, br1, br2, br3 = board                      # Board rows
-        hr0, hr1, hr2, hr3 = self.SNAKE_HEURISTIC_3     # Snake heuristic rows
-        return (
-            br0[0]*hr0[0] + br0[1]*hr0[1] + br0[2]*hr0[2] + br0[3]*hr0[3] +
-            br1[0]*hr1[0] + br1[1]*hr1[1] + br1[2]*hr1[2] + br1[3]*hr1[3] +
-            br2[0]*hr2[0] + br2[1]*hr2[1] + br2[2]*hr2[2] + br2[3]*hr2[3] +
-            br3[0]*hr3[0] + br3[1]*hr3[1] + br3[2]*hr3[2] + br3[3]*hr3[3]
-        )
+        return scoreBoard(board, self.HEURISTIC_TABLES)
+                
 
-    def __shift(self, board: list, original_board: list, direction: int) -> list:
+def simulateBoard(board: int, players_turn: bool, expansion_depth: int, rollout_policy, deadline: float = None) -> int:
+    """
+    This simulates a game from the given packed board with a max number of turns and returns the final board score.
+    It is the simulation step of both MCTSNode and MCTSTree.
+    
+    :param board: The packed 2048 board to simulate from.
+    :type board: int
+    :param players_turn: If it is the player's turn to shift tiles on the board.
+    :type players_turn: bool
+    :param expansion_depth: How many turns to simulate in the 2048 game.
+    :type expansion_depth: int
+    :param rollout_policy: Picks the player's moves with getNextDirectionPacked, e.g, Expectiminimax2048 or GreedyRolloutPolicy.
+                           None plays uniformly random moves.
+    :param deadline: The time.perf_counter() deadline of a timed search, the rollout stops and scores its current board once it passes.
+                     None always plays every turn.
+    :type deadline: float
+    :return: The heuristic score of the final board.
+    :rtype: int
+    """
+    simulation_board = board
+    game_over = False
+    i = 0
+    while i < expansion_depth and not game_over:
+        if deadline is not None and time.perf_counter() > deadline: break
+        if players_turn:
+            if rollout_policy:
+                if deadline is not None and isinstance(rollout_policy, Expectiminimax2048): # Deepens up to its own depth while time is left
+                    time_left_ms = (deadline - time.perf_counter()) * 1000
+                    direction = rollout_policy.getNextDirectionPacked(simulation_board, time_left_ms, rollout_policy.depth)
+                else:
+                    direction = rollout_policy.getNextDirectionPacked(simulation_board)
+                simulation_board, _, board_changed = move(simulation_board, direction)
+                if not board_changed and direction == Direction.UP.value: game_over = True
+            else:
+                directions = [Direction.DOWN.value, Direction.RIGHT.value, Direction.LEFT.value, Direction.UP.value]
+                board_changed = False
+                while not board_changed and not game_over:
+                    if len(directions) == 0:
+                        game_over = True
+                        continue
+                    direction = directions.pop(r.randrange(len(directions)))
+                    simulation_board, _, board_changed = move(simulation_board, direction)
+        else:
+            open_cells = getOpenCells(simulation_board)
+
+            if len(open_cells) > 0:
+                y, x  = r.choice(open_cells)
+                tile_probability_num = r.random()
+                if tile_probability_num < MCTSNode.TILE_2_CHANCE:
+                    simulation_board = setExponent(simulation_board, y, x, 1)
+                else:
+                    simulation_board = setExponent(simulation_board, y, x, 2)
+        players_turn = not players_turn
+        i += 1
+
+    return scoreBoard(simulation_board, MCTSNode.HEURISTIC_TABLES)
+
+class GreedyRolloutPolicy:
+    """
+    This class is a cheap rollout policy: the legal move whose shifted board has the best snake heuristic score, a 1-ply search.
+    With epsilon, that share of the moves is a uniformly random legal move instead.
+    The greedy moves are memoized by board and shared by every rollout of every search.
+    """
+
+    MAX_MEMO_ENTRIES = 1 << 20
+
+    def __init__(self, epsilon: float = 0.0):
         """
-        This shifts the tiles of the given board in one of the 4 cardinal directions.
+        This sets up the heuristic tables and the empty memo.
         
-        :param board: The given 4x4 2048 board to shift.
-        :type board: list
-        :param original_board: The original 4x4 2048 board before the shift.
-        :type original_board: list
-        :param direction: The direction to shift the board tiles. 
-        :type direction: int
-        :return: True if the tiles on the board have changed positions, False otherwise.
-        :rtype: list
+        :param epsilon: The chance of a uniformly random legal move instead of the greedy one.
+        :type epsilon: float
         """
-        if direction == Direction.UP.value:
-            for col in range(self.MAX_BOARD_DIMENSION):
-                original_col_values = [row[col] for row in board][::-1] # Column in reverse order (going up)
-                final_col_values = self.__merge(original_col_values)[::-1]
-                for row in range(self.MAX_BOARD_DIMENSION):
-                    board[row][col] = final_col_values[row]
-        elif direction == Direction.DOWN.value:
-            for col in range(self.MAX_BOARD_DIMENSION):
-                original_col_values = [row[col] for row in board] # Column in normal order (going down)
-                final_col_values = self.__merge(original_col_values)
-                for row in range(self.MAX_BOARD_DIMENSION):
-                    board[row][col] = final_col_values[row]
-        elif direction == Direction.LEFT.value:
-            for row in range(self.MAX_BOARD_DIMENSION):
-                original_row_values = board[row][::-1] # Row in reverse order
-                final_row_values = self.__merge(original_row_values)[::-1]
-                board[row] = final_row_values
-        elif direction == Direction.RIGHT.value:
-            for row in range(self.MAX_BOARD_DIMENSION):
-                original_row_values = board[row] # Row in normal order
-                final_row_values = self.__merge(original_row_values)
-                board[row] = final_row_values
-        else:
-            return False # Invalid direction
-
-        return original_board != board
+        self.epsilon = epsilon
+        self.heuristic_tables = MCTSNode.HEURISTIC_TABLES
+        self.memo = {} # board -> greedy direction
 
-    def __merge(self, list_values: list) -> list:
+    def getNextDirectionPacked(self, board: int) -> int:
         """
-        This merges and combines numbers from right to right for a single row/column.\n
-        It start are the right and merges values in the right direction.\n
+        This returns the rollout move for the given packed board.
         
-        :param list_values: The row/column list of values to combine.
-        :type list_values: list
-        :return: The updated row/column list of values after the being merged.
-        :rtype: list
+        :param board: The given packed 2048 board.
+        :type board: int
+        :return: The direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT, UP if no move is legal.
+        :rtype: int
         """
-        list_values = [tile for tile in list_values if tile != self.BLANK_TILE]
-        final_values = []
-        i = len(list_values) - 1
-        while i >= 0:
-            if i - 1 >= 0 and list_values[i] == list_values[i-1]:
-                new_tile = list_values[i] * 2
-                final_values.append(new_tile)
-                i -= 2
-            else:
-                final_values.append(list_values[i])
-                i -= 1
+        if self.epsilon and r.random() < self.epsilon:
+            directions = getLegalDirections(board)
+            return r.choice(directions) if directions else Direction.UP.value
 
-        while len(final_values) < self.MAX_BOARD_DIMENSION:
-            final_values.append(0)
-        return final_values[::-1]
-                
+        direction = self.memo.get(board)
+        if direction is None:
+            direction = Direction.UP.value
+            highest_heuristic = -1
+            for shift_direction in DIRECTIONS:
+                board_copy = shiftBoard(board, shift_direction)
+                if board_copy != board:
+                    heuristic = scoreBoard(board_copy, self.heuristic_tables)
+                    if heuristic > highest_heuristic:
+                        highest_heuristic = heuristic
+                        direction = shift_direction
+            if len(self.memo) >= self.MAX_MEMO_ENTRIES: self.memo.clear()
+            self.memo[board] = direction
+        return direction
 
 class MonteCarlo2048:
     """
     This classes uses the Monte Carlo Tree Search algorithm to determine the "best" next move in 2048.
     """
 
-    def __init__(self, selection_iterations: int, expansion_depth: int, C: float, expectiminimax):
+    def __init__(self, selection_iterations: int, expansion_depth: int, C: float, expectiminimax, compact_tree: bool = False, reuse_tree: bool = False,
+                 workers: int = 0, batch_rollouts: int = 0, rollout_policy: str = None, epsilon: float = 0.1, leaf_evaluation_depth: int = 0,
+                 chance_outcomes: bool = False, widening_constant: float = 1.0, widening_exponent: float = 0.5, transpositions: bool = False):
         """
         This sets up the variables needed for MCTS to function.
         
@@ -321,43 +414,442 @@ class MonteCarlo2048:
         :param C: The exploration constant used to adjust weighting in UCB1.
         :type C: float
         :param expectiminimax: The model for Expectiminimax which may be None.
+        :param compact_tree: If the tree is kept in the arrays of one MCTSTree, reused every move, instead of MCTSNode objects.
+        :type compact_tree: bool
+        :param reuse_tree: If the tree is kept between moves, the grandchild for the chosen move and the observed tile spawn
+                           becoming the next root. A spawn that was never expanded starts a fresh root.
+        :type reuse_tree: bool
+        :param workers: The number of worker processes that each search their own tree from the root with a different seed,
+                        their root child visits and rewards are summed. 0 searches one tree in this process.
+                        Trees are not reused across workers, so it cannot be combined with reuse_tree. The expectiminimax model is
+                        pickled to every worker, so it must not have a worker pool of its own running.
+        :type workers: int
+        :param batch_rollouts: The number of random rollouts played at once with NumPy from each expanded leaf, their mean is backpropagated.
+                               0 plays one rollout in Python. Batches are random rollouts, so they need rollout_policy "random",
+                               or None without expectiminimax, and NumPy.
+        :type batch_rollouts: int
+        :param rollout_policy: How the rollouts pick moves: "random", "greedy" (1-ply snake heuristic), "epsilon_greedy",
+                               or "expectiminimax". None uses expectiminimax if it is given and random moves otherwise.
+        :type rollout_policy: str
+        :param epsilon: The share of random moves of the "epsilon_greedy" rollout policy.
+        :type epsilon: float
+        :param leaf_evaluation_depth: Expanded leaves are scored by an Expectiminimax search of this depth, e.g, 1 or 2, instead of rollouts.
+                                      The scores are kept in the evaluator's transposition table, each search a new generation,
+                                      so the leaves later searches no longer reach are evicted first. 0 plays rollouts.
+        :type leaf_evaluation_depth: int
+        :param chance_outcomes: If the children of a tile spawn node are (cell, tile) outcomes sampled by their probability during selection,
+                                instead of one child per cell with the tile picked once at expansion.
+        :type chance_outcomes: bool
+        :param widening_constant: With chance_outcomes, a spawn node with N visits materializes at most widening_constant * (N + 1)^widening_exponent
+                                  outcomes, a sampled outcome past that limit is replaced by one of the existing outcomes.
+        :type widening_constant: float
+        :param widening_exponent: The exponent of the progressive widening limit.
+        :type widening_exponent: float
+        :param transpositions: If the nodes reaching the same board and turn by different move and spawn orders are shared,
+                               turning the MCTSNode tree into a DAG with per-edge visit counts for UCB1.
+                               It cannot be combined with compact_tree, whose nodes have one parent, or with reuse_tree,
+                               since a DAG has no single subtree to keep.
+        :type transpositions: bool
         """
         self.selection_iterations = selection_iterations
         self.expansion_depth = expansion_depth
         self.C = C
         self.emm = expectiminimax
+        self.rollout_policy = rollout_policy
+        self.epsilon = epsilon
+        match rollout_policy:
+            case "random":
+                self.policy = None
+            case "greedy":
+                self.policy = GreedyRolloutPolicy()
+            case "epsilon_greedy":
+                self.policy = GreedyRolloutPolicy(epsilon)
+            case "expectiminimax":
+                if expectiminimax is None: raise ValueError("the \"expectiminimax\" rollout policy needs an expectiminimax model")
+                self.policy = expectiminimax
+            case None:
+                self.policy = expectiminimax
+            case _:
+                raise ValueError(f"unknown rollout policy: {rollout_policy!r}")
+        self.leaf_evaluation_depth = leaf_evaluation_depth
+        self.evaluator = None
+        if leaf_evaluation_depth > 0 and (batch_rollouts or rollout_policy is not None or expectiminimax is not None):
+            raise ValueError("leaf_evaluation_depth replaces rollouts, it cannot be combined with batch_rollouts, a rollout policy or expectiminimax")
+        if leaf_evaluation_depth > 0: # The same snake heuristic as the rollouts, so the scores need the same UCB1 normalization
+            self.evaluator = Expectiminimax2048(leaf_evaluation_depth, 3, cache_size=200000, persistent_cache=True)
+        self.chance_outcomes = chance_outcomes
+        if transpositions and compact_tree:
+            raise ValueError("transpositions share nodes between parents, which the compact tree cannot store")
+        if transpositions and reuse_tree:
+            raise ValueError("transpositions cannot be combined with reuse_tree, a DAG has no single subtree to keep")
+        self.transpositions = transpositions
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+        self.tree = MCTSTree() if compact_tree else None
+        if workers and reuse_tree:
+            raise ValueError("workers search fresh trees every move, they cannot be combined with reuse_tree")
+        self.reuse_tree = reuse_tree
+        self.workers = workers
+        if batch_rollouts and self.policy is not None:
+            raise ValueError("batch_rollouts only plays random rollouts, it cannot be combined with a rollout policy or expectiminimax")
+        self.batch_rollouts = batch_rollouts
+        self.rng = None
+        self.heuristic_arrays = None
+        self.simulate_batch = None
+        if batch_rollouts:
+            import numpy as np # Only batched rollouts need NumPy
+            from batch import simulateBoardBatch
+            self.simulate_batch = simulateBoardBatch
+            self.rng = np.random.default_rng(r.getrandbits(64)) # Seeded from the random module, so a seeded game is reproducible
+            self.heuristic_arrays = [np.array(table, dtype=np.int64) for table in MCTSNode.HEURISTIC_TABLES]
+        self.pool = None # Created on the first parallel search and kept for every later move and game
+        self.root = None # The root of the last search, MCTSNode or MCTSTree node, kept if reuse_tree
+        self.last_direction = None
+        self.stats = {}
 
-    def getNextDirection(self, original_board: list) -> int:
+    def getNextDirection(self, original_board: list, time_budget_ms: float = None) -> int:
         """
-        Docstring for getNextDirection
+        This returns the most visited direction after running the MCTS iterations from the given board.
         
-        :param original_board: Description
+        :param original_board: The given 4x4 2048 board.
         :type original_board: list
-        :return: Description
+        :param time_budget_ms: The per-move time budget, iterations run until it is used up. None runs the selection iterations.
+        :type time_budget_ms: float
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
         :rtype: int
         """
-        root = MCTSNode(original_board, None, None, True)
+        return self.getNextDirectionPacked(packBoard(original_board), time_budget_ms)
+
+    def getNextDirectionPacked(self, board: int, time_budget_ms: float = None) -> int:
+        """
+        This returns the most visited direction after running the MCTS iterations from the given packed board.\n
+        With a time budget, selection, expansion, simulation and backpropagation repeat until the deadline passes,
+        at least once so there is a move.\n
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param time_budget_ms: The per-move time budget, iterations run until it is used up. None runs the selection iterations.
+        :type time_budget_ms: float
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + time_budget_ms / 1000 if time_budget_ms is not None else None
+        if self.workers > 0: return self.__getNextDirectionParallel(board, start_time, time_budget_ms)
+        if self.evaluator: self.evaluator.table.newGeneration()
+        if self.tree: return self.__getNextDirectionCompact(board, start_time, deadline, time_budget_ms)
+
+        root = self.__getReusedRoot(board) if self.reuse_tree else None
+        if root is None: root = MCTSNode(board, None, None, True)
+        reused_visits = root.visits
+        table = {root.board << 1 | True: root} if self.transpositions else None
         #original_heuristic = root.getHeuristicSnakeScore(original_board)
         
-        for i in range(self.selection_iterations):
+        iterations = 0
+        while self.__keepSearching(iterations, deadline):
+            iterations += 1
             node = root
+            path = [root]
 
-            while not node.game_over and len(node.available_actions) == 0:
-                node = node.selectBestChild(self.C)                         # Selection
+            expanded = False
+            while not expanded and not node.game_over:
+                if self.chance_outcomes and not node.players_turn:         # Selection or expansion of a tile spawn
+                    node, expanded = node.sampleOutcome(self.widening_constant, self.widening_exponent, table)
+                elif len(node.available_actions) > 0:
+                    node = node.expandNode(table)                           # Expansion
+                    expanded = True
+                else:
+                    node = node.selectBestChild(self.C)                     # Selection
+                path.append(node)
 
-            if not node.game_over and len(node.available_actions) > 0:
-                node = node.expandNode()                                    # Expansion
+            heuristic = self.__simulate(node.board, node.players_turn, deadline) # Simulation
 
-            heuristic = node.simulateNode(self.expansion_depth, self.emm)   # Simulation
+            if table is None:                                               # Backpropagation
+                node.backPropagation(heuristic)
+            else:
+                MCTSNode.backPropagatePath(path, heuristic)
 
-            node.backPropagation(heuristic)                                 # Backpropagation
+        if table is None:
+            root_children = [(child.direction, child.visits, child.reward) for child in root.children]
+        else: # A shared child can have visits from other parents, the root's own are on its edges
+            root_children = [
+                (child.direction, root.edge_visits[child], child.reward / child.visits * root.edge_visits[child]) for child in root.children
+            ]
+        best_direction = self.__finishSearch(root, root_children, reused_visits, root.visits, iterations, start_time, time_budget_ms)
+        if table is not None: self.stats["nodes"] = len(table)
+        return best_direction
+
+    def getStats(self) -> dict:
+        """
+        This gets the statistics of the last search, e.g, the root visits and how many came from the reused tree.
+        
+        :return: The last search statistics.
+        :rtype: dict
+        """
+        return self.stats
+
+    def close(self):
+        """
+        This shuts down the worker pool, if one was started.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __getReusedRoot(self, board: int) -> MCTSNode:
+        """
+        This finds the grandchild of the last root for the last chosen direction and the given board, and makes it the root.
+        
+        :param board: The given packed 2048 board, after the last chosen direction and a tile spawn.
+        :type board: int
+        :return: The reused root, or None if the spawn was never expanded.
+        :rtype: MCTSNode
+        """
+        if self.root is None: return None
+        for child in self.root.children:
+            if child.direction == self.last_direction:
+                for grandchild in child.children:
+                    if grandchild.board == board:
+                        grandchild.parent = None # The rest of the old tree is released with the old root
+                        return grandchild
+        return None
 
+    def __simulate(self, board: int, players_turn: bool, deadline: float) -> float:
+        """
+        This scores an expanded leaf with a shallow Expectiminimax search, a batch of NumPy rollouts, or one rollout.
+        
+        :param board: The packed 2048 board of the leaf.
+        :type board: int
+        :param players_turn: If it is the player's turn to shift tiles on the board.
+        :type players_turn: bool
+        :param deadline: The time.perf_counter() deadline of a timed search, rollouts are cut short once it passes. None plays them out.
+        :type deadline: float
+        :return: The heuristic score of the leaf.
+        :rtype: float
+        """
+        if self.evaluator: # A leaf seen before is answered by the evaluator's transposition table
+            return self.evaluator.getBoardScore(board, self.leaf_evaluation_depth, players_turn)
+        if self.batch_rollouts:
+            return self.simulate_batch(board, players_turn, self.expansion_depth, self.batch_rollouts, self.rng, self.heuristic_arrays, deadline)
+        return simulateBoard(board, players_turn, self.expansion_depth, self.policy, deadline)
+
+    def __keepSearching(self, iterations: int, deadline: float) -> bool:
+        """
+        This checks if another MCTS iteration should run.
+        
+        :param iterations: The iterations run so far.
+        :type iterations: int
+        :param deadline: The time.perf_counter() deadline of a timed search, None runs the selection iterations.
+        :type deadline: float
+        :return: True if another iteration should run.
+        :rtype: bool
+        """
+        if deadline is None: return iterations < self.selection_iterations
+        return iterations == 0 or time.perf_counter() < deadline
+
+    def __finishSearch(self, root, root_children: list, reused_visits: int, root_visits: int, iterations: int, start_time: float,
+                       time_budget_ms: float) -> int:
+        """
+        This picks the most visited root child, keeps the root for the next move if the tree is reused, and records the search statistics.
+        
+        :param root: The root of the search, an MCTSNode or an MCTSTree node.
+        :param root_children: The (direction, visits, reward) of every root child, in expansion order.
+        :type root_children: list
+        :param reused_visits: The root visits carried over from the last search.
+        :type reused_visits: int
+        :param root_visits: The root visits after the search.
+        :type root_visits: int
+        :param iterations: The iterations run.
+        :type iterations: int
+        :param start_time: The time.perf_counter() the search started at.
+        :type start_time: float
+        :param time_budget_ms: The per-move time budget, None if the selection iterations ran.
+        :type time_budget_ms: float
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
         best_direction = Direction.UP.value
         best_visits = 0
-        for child in root.children:
-            #print(child.reward)
-            if child.visits > best_visits:
-                best_direction = child.direction
-                best_visits = child.visits
-        #print(best_direction)
+        for direction, visits, _ in root_children:
+            if visits > best_visits:
+                best_direction = direction
+                best_visits = visits
+
+        if self.reuse_tree:
+            self.root = root
+            self.last_direction = best_direction
+        self.stats = {
+            "iterations": iterations,
+            "time_ms": (time.perf_counter() - start_time) * 1000,
+            "time_budget_ms": time_budget_ms,
+            "root_visits": root_visits,
+            "reused_visits": reused_visits,
+            "root_children": root_children,
+        }
+        return best_direction
+
+    def __getNextDirectionCompact(self, board: int, start_time: float, deadline: float, time_budget_ms: float) -> int:
+        """
+        This runs the same MCTS iterations as getNextDirectionPacked on the compact MCTSTree.
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param start_time: The time.perf_counter() the search started at.
+        :type start_time: float
+        :param deadline: The time.perf_counter() deadline of a timed search, None runs the selection iterations.
+        :type deadline: float
+        :param time_budget_ms: The per-move time budget the deadline was set from, reported in the statistics.
+        :type time_budget_ms: float
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        tree = self.tree
+        root = self.__getReusedTreeRoot(board) if self.reuse_tree else tree.NO_NODE
+        if root == tree.NO_NODE:
+            tree.clear()
+            root = tree.addNode(board, tree.NO_NODE, 0, True)
+        reused_visits = tree.visits[root]
+        untried = tree.untried
+        players_turn = tree.players_turn
+
+        iterations = 0
+        while self.__keepSearching(iterations, deadline):
+            iterations += 1
+            node = root
+
+            expanded = False
+            while not expanded and not tree.isGameOver(node):
+                if self.chance_outcomes and not players_turn[node]:        # Selection or expansion of a tile spawn
+                    node, expanded = tree.sampleOutcome(node, self.widening_constant, self.widening_exponent)
+                elif untried[node] != 0:
+                    node = tree.expandNode(node)                            # Expansion
+                    expanded = True
+                else:
+                    node = tree.selectBestChild(node, self.C)               # Selection
+
+            heuristic = self.__simulate(tree.board[node], tree.players_turn[node], deadline) # Simulation
+
+            tree.backPropagation(node, heuristic)                           # Backpropagation
+
+        root_children = [(tree.action[child], tree.visits[child], tree.reward[child]) for child in tree.getChildren(root)]
+        return self.__finishSearch(root, root_children, reused_visits, tree.visits[root], iterations, start_time, time_budget_ms)
+
+    def __getReusedTreeRoot(self, board: int) -> int:
+        """
+        This finds the grandchild of the last root for the last chosen direction and the given board,
+        makes it the root and releases the rest of the old tree.
+        
+        :param board: The given packed 2048 board, after the last chosen direction and a tile spawn.
+        :type board: int
+        :return: The reused root, or NO_NODE if the spawn was never expanded.
+        :rtype: int
+        """
+        tree = self.tree
+        if self.root is None: return tree.NO_NODE
+        for child in tree.getChildren(self.root):
+            if tree.action[child] == self.last_direction:
+                for grandchild in tree.getChildren(child):
+                    if tree.board[grandchild] == board:
+                        tree.promoteToRoot(grandchild, self.root)
+                        return grandchild
+        return tree.NO_NODE
+
+    def __getNextDirectionParallel(self, board: int, start_time: float, time_budget_ms: float) -> int:
+        """
+        This searches an independent tree from the root board in every worker, each with its own seed drawn from this process,
+        and picks the direction with the most visits summed over the workers.
+        
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param start_time: The time.perf_counter() the search started at.
+        :type start_time: float
+        :param time_budget_ms: The per-move time budget of every worker, None runs the selection iterations.
+        :type time_budget_ms: float
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=initWorker,
+                initargs=(
+                    self.selection_iterations, self.expansion_depth, self.C, self.emm, self.tree is not None,
+                    self.batch_rollouts, self.rollout_policy, self.epsilon, self.leaf_evaluation_depth,
+                    self.chance_outcomes, self.widening_constant, self.widening_exponent, self.transpositions
+                )
+            )
+
+        tasks = [(board, r.getrandbits(64), time_budget_ms) for _ in range(self.workers)]
+        visits = {}
+        rewards = {}
+        iterations = 0
+        for root_children, worker_iterations in self.pool.map(searchRootWorker, tasks):
+            iterations += worker_iterations
+            for direction, child_visits, child_reward in root_children:
+                visits[direction] = visits.get(direction, 0) + child_visits
+                rewards[direction] = rewards.get(direction, 0.0) + child_reward
+
+        root_children = [(direction, visits[direction], rewards[direction]) for direction in DIRECTIONS if direction in visits]
+        best_direction = self.__finishSearch(None, root_children, 0, sum(visits.values()), iterations, start_time, time_budget_ms)
+        self.stats["workers"] = self.workers
         return best_direction
+
+worker_montecarlo = None # The searcher of a worker process in the pool
+
+def initWorker(selection_iterations: int, expansion_depth: int, C: float, expectiminimax, compact_tree: bool, batch_rollouts: int,
+               rollout_policy: str, epsilon: float, leaf_evaluation_depth: int, chance_outcomes: bool, widening_constant: float,
+               widening_exponent: float, transpositions: bool):
+    """
+    This creates the searcher a worker process keeps for every task it runs.
+    
+    :param selection_iterations: The number of iterations each worker runs per move.
+    :type selection_iterations: int
+    :param expansion_depth: The max number of moves simulated on a node.
+    :type expansion_depth: int
+    :param C: The exploration constant used to adjust weighting in UCB1.
+    :type C: float
+    :param expectiminimax: The model for Expectiminimax which may be None, each worker gets its own copy.
+    :param compact_tree: If the worker's tree is a compact MCTSTree.
+    :type compact_tree: bool
+    :param batch_rollouts: The number of NumPy rollouts per expanded leaf, 0 plays one rollout in Python.
+    :type batch_rollouts: int
+    :param rollout_policy: How the rollouts pick moves, see MonteCarlo2048.
+    :type rollout_policy: str
+    :param epsilon: The share of random moves of the "epsilon_greedy" rollout policy.
+    :type epsilon: float
+    :param leaf_evaluation_depth: The Expectiminimax depth that scores expanded leaves instead of rollouts, 0 plays rollouts.
+    :type leaf_evaluation_depth: int
+    :param chance_outcomes: If tile spawn nodes sample (cell, tile) outcomes with progressive widening.
+    :type chance_outcomes: bool
+    :param widening_constant: The constant of the progressive widening limit.
+    :type widening_constant: float
+    :param widening_exponent: The exponent of the progressive widening limit.
+    :type widening_exponent: float
+    :param transpositions: If the nodes with the same board and turn are shared.
+    :type transpositions: bool
+    """
+    global worker_montecarlo
+    worker_montecarlo = MonteCarlo2048(
+        selection_iterations, expansion_depth, C, expectiminimax, compact_tree=compact_tree, batch_rollouts=batch_rollouts,
+        rollout_policy=rollout_policy, epsilon=epsilon, leaf_evaluation_depth=leaf_evaluation_depth,
+        chance_outcomes=chance_outcomes, widening_constant=widening_constant, widening_exponent=widening_exponent,
+        transpositions=transpositions
+    )
+
+def searchRootWorker(task: tuple) -> tuple:
+    """
+    This searches one tree from the root board in a worker process.
+    
+    :param task: The packed root board, the seed of this worker's tree and the time budget.
+    :type task: tuple
+    :return: The (direction, visits, reward) of every root child and the iterations run.
+    :rtype: tuple
+    """
+    board, seed, time_budget_ms = task
+    r.seed(seed)
+    if worker_montecarlo.batch_rollouts:
+        import numpy as np
+        worker_montecarlo.rng = np.random.default_rng(seed)
+    worker_montecarlo.getNextDirectionPacked(board, time_budget_ms)
+    stats = worker_montecarlo.getStats()
+    return stats["root_children"], stats["iterations"]
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+
+class TranspositionTable:
+    """
+    This class memoizes search values by packed board and remaining search depth.
+    An entry stored at a remaining depth can answer any lookup at an equal or smaller depth.
+    An entry is either an exact value or an upper bound from a pruned search, which only answers lookups whose alpha is at or above it.
+    Once the table holds max_entries, the oldest inserted entry is evicted first.
+    The table can be kept across searches, each search starting a new generation. An entry hit by a later generation
+    is moved to the back of the eviction order, so entries no later search has used are evicted first.
+    """
+
+    def __init__(self, max_entries: int):
+        """
+        This sets up an empty table and its statistics.
+
+        :param max_entries: The max number of entries held before evicting.
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # key -> (depth, value, generation, upper_bound), oldest generation first
+        self.generation = 0
+        self.hits = 0
+        self.previous_hits = 0 # Hits on entries stored by an earlier generation
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: int, depth: int, alpha: float = None):
+        """
+        This looks up a value searched to at least the given depth.
+
+        :param key: The table key, a packed board with its player's turn flag.
+        :type key: int
+        :param depth: The remaining search depth needed.
+        :type depth: int
+        :param alpha: The score at or below which the caller only needs a bound, None for an exact value.
+        :type alpha: float
+        :return: The stored value, or None on a miss.
+        """
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is not None and entry[0] >= depth and (not entry[3] or (alpha is not None and entry[1] <= alpha)):
+            self.hits += 1
+            if entry[2] != self.generation: # Still in use, so it moves behind the stale entries
+                self.previous_hits += 1
+                entries[key] = (entry[0], entry[1], self.generation, entry[3])
+                entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key: int, depth: int, value, upper_bound: bool = False):
+        """
+        This stores a value in the current generation, evicting the oldest entry if the table is full.
+
+        :param key: The table key, a packed board with its player's turn flag.
+        :type key: int
+        :param depth: The remaining search depth the value was searched to.
+        :type depth: int
+        :param value: The value to store.
+        :param upper_bound: If the value is only an upper bound of the board's score.
+        :type upper_bound: bool
+        """
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+        elif len(entries) >= self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+        entries[key] = (depth, value, self.generation, upper_bound)
+
+    def newGeneration(self):
+        """
+        This starts a new generation, called once per search when the table is kept across searches.
+        """
+        self.generation += 1
+
+    def clear(self):
+        """
+        This removes every entry, the statistics are kept.
+        """
+        self.entries.clear()
+
+    def resetStats(self):
+        """
+        This resets the hit, miss and eviction counters.
+        """
+        self.hits = 0
+        self.previous_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def addStats(self, hits: int, previous_hits: int, misses: int, evictions: int):
+        """
+        This adds the counters of a table searched elsewhere, e.g, in a worker process, to this table's statistics.
+
+        :param hits: The hits to add.
+        :type hits: int
+        :param previous_hits: The hits on entries of an earlier generation to add.
+        :type previous_hits: int
+        :param misses: The misses to add.
+        :type misses: int
+        :param evictions: The evictions to add.
+        :type evictions: int
+        """
+        self.hits += hits
+        self.previous_hits += previous_hits
+        self.misses += misses
+        self.evictions += evictions
+
+    def getStats(self) -> dict:
+        """
+        This gets the table statistics.
+
+        :return: The hits, hits on earlier generations, misses, evictions, hit rates, generation and current number of entries.
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "previous_hits": self.previous_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "previous_hit_rate": self.previous_hits / lookups if lookups else 0.0,
+            "generation": self.generation,
+            "entries": len(self.entries),
+        }
@@ -29,6 +29,7 @@ class UI2048:
     COLOR_LABEL_TEXT = "#736452"
     COLOR_BUTTON_TEXT = "#FFFFFF" # "#f2f0e5"
     COLOR_BUTTON_BACKGROUND = COLOR_BOARD
+    MCTS_TIME_BUDGET_MS = None # The per-move time budget of the MCTS modes, None runs their selection iterations
     RUN = True
 
     def __init__(self, model, expectiminimax, mcts, mcts_emm):
@@ -266,9 +267,9 @@ class UI2048:
             case UIMode.EXPECTIMINIMAX.value:
                 self.model.playAction(self.expectiminimax.getNextDirection(self.model.getBoard()))
             case UIMode.MCTS.value:
-                self.model.playAction(self.mcts.getNextDirection(self.model.getBoard()))
+                self.model.playAction(self.mcts.getNextDirection(self.model.getBoard(), self.MCTS_TIME_BUDGET_MS))
             case UIMode.MCTS_EMM.value:
-                self.model.playAction(self.mcts_emm.getNextDirection(self.model.getBoard()))                
+                self.model.playAction(self.mcts_emm.getNextDirection(self.model.getBoard(), self.MCTS_TIME_BUDGET_MS))
 
     def checkSetMode(self, key) -> bool:
         """
@@ -311,10 +312,10 @@ class UI2048:
 
 def main():
     model = Model2048()
-    expectiminimax = Expectiminimax2048(5, 3) # Search depth of 5 is the max before the time increase becomes too much!
-    expectiminimax_weak = Expectiminimax2048(3, 3)
-    montecarlo = MonteCarlo2048(1500, 30, 1.4, None)
-    mcts_emm = MonteCarlo2048(50, 30, 1.25, expectiminimax_weak)
+    expectiminimax = Expectiminimax2048(5, 3, cache_size=200000) # Search depth of 5 is the max before the time increase becomes too much!
+    expectiminimax_weak = Expectiminimax2048(3, 3, cache_size=200000, persistent_cache=True) # The MCTS simulations search the same boards again and again
+    montecarlo = MonteCarlo2048(1500, 30, 1.4, None, compact_tree=True)
+    mcts_emm = MonteCarlo2048(50, 30, 1.25, expectiminimax_weak, compact_tree=True)
     game = UI2048(model, expectiminimax, montecarlo, mcts_emm)
     game.run()
 
@@ -0,0 +1,186 @@
+import numpy as np
+import time
+from model import Model2048, Direction
+from batch import moveBatch, canMoveBatch, getExponentsBatch, getRowScoresBatch, CELL_SHIFTS
+from engine import DIRECTIONS
+from expectiminimax import Expectiminimax2048, DepthPolicy
+
+class VectorExpectiminimax2048(Expectiminimax2048):
+    """
+    This class is a drop-in replacement for Expectiminimax2048 that searches the tree breadth first with NumPy.
+    It takes the same options, and rejects the ones that change which nodes are searched: the probability cutoff, workers,
+    pruning and sampling.
+    Each level of the tree is one frontier of packed boards with the index of their parent,
+    the whole frontier is shifted, spawned and scored with vectorized calls,
+    and the scores are reduced back up level by level with max and mean operations.
+    It searches the same tree as the recursive search without a transposition table, so both pick the same move.
+    """
+
+    def __init__(self, depth: int, snake: int, cache_size: int = 0, probability_cutoff: float = 0.0, depth_policy: DepthPolicy = None, workers: int = 0, pruning: bool = False,
+                 sample_limit: int = 0, sample_size: int = 6, sample_seed: int = 0, persistent_cache: bool = False):
+        """
+        This sets up the variables needed for the vectorized Expectiminimax to function.
+
+        :param depth: The search depth of the AI solver/search.
+        :type depth: int
+        :param snake: Which snake heuristic to use.
+        :type snake: int
+        :param cache_size: The max number of transposition table entries of timed searches, which fall back to the recursive search.
+                           The breadth-first search does not use the table.
+        :type cache_size: int
+        :param probability_cutoff: Not supported, it must be 0.
+        :type probability_cutoff: float
+        :param depth_policy: Picks the search depth per move from the board, None always searches to the fixed depth.
+        :type depth_policy: DepthPolicy
+        :param workers: Not supported, it must be 0.
+        :type workers: int
+        :param pruning: Not supported, it must be False.
+        :type pruning: bool
+        :param sample_limit: Not supported, it must be 0.
+        :type sample_limit: int
+        :param sample_size: Unused without sampling.
+        :type sample_size: int
+        :param sample_seed: Unused without sampling.
+        :type sample_seed: int
+        :param persistent_cache: If the transposition table of timed searches is kept across moves, see Expectiminimax2048.
+        :type persistent_cache: bool
+        """
+        if probability_cutoff or workers or pruning or sample_limit:
+            raise ValueError("VectorExpectiminimax2048 does not support probability_cutoff, workers, pruning or sample_limit")
+        super().__init__(depth, snake, cache_size, depth_policy=depth_policy, sample_size=sample_size, sample_seed=sample_seed,
+                         persistent_cache=persistent_cache)
+        self.heuristic_arrays = [np.array(table, dtype=np.int64) for table in self.heuristic_tables]
+
+    def getHeuristicScores(self, boards: np.ndarray) -> np.ndarray:
+        """
+        This gets the snake heuristic score of every packed board in the array.
+
+        :param boards: The packed boards.
+        :type boards: np.ndarray
+        :return: The heuristic scores.
+        :rtype: np.ndarray
+        """
+        return getRowScoresBatch(boards, self.heuristic_arrays)
+
+    def getNextDirectionPacked(self, board: int, time_budget_ms: float = None, max_depth: int = None) -> int:
+        """
+        This returns the "best" direction to shift the tiles in the given packed board.\n
+        Timed searches need to stop part way through a level, so they fall back to the recursive iterative deepening search.\n
+
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param time_budget_ms: The per-move time budget, None searches to the fixed depth breadth first.
+        :type time_budget_ms: float
+        :param max_depth: The deepest iteration of a timed search, None deepens up to MAX_ITERATIVE_DEPTH.
+        :type max_depth: int
+        :return: The best direction to move: 1: UP, 2: DOWN, 3: LEFT, 4: RIGHT.
+        :rtype: int
+        """
+        if time_budget_ms is not None: return super().getNextDirectionPacked(board, time_budget_ms, max_depth)
+
+        start_time = time.perf_counter()
+        depth = self.depth_policy.getDepth(board) if self.depth_policy else self.depth
+        levels = self.__expandLevels(board, depth)
+        root_scores = self.__reduceLevels(levels)
+
+        best_direction = Direction.UP.value
+        highest_heuristic = 0
+        for i, direction in enumerate(DIRECTIONS):
+            if root_scores[i] > highest_heuristic:
+                highest_heuristic = root_scores[i]
+                best_direction = direction
+
+        self.stats = {
+            "depth": depth,
+            "nodes": sum(len(level["boards"]) for level in levels),
+            "level_sizes": [len(level["boards"]) for level in levels],
+            "time_ms": (time.perf_counter() - start_time) * 1000,
+        }
+        if self.depth_policy: self.stats["depth_policy"] = self.depth_policy.getThresholds()
+        return best_direction
+
+    def __expandLevels(self, board: int, depth: int) -> list:
+        """
+        This builds every level of the search tree from the root board down to the search depth.\n
+        Player levels are expanded with the 4 directions and game levels with a 2 and a 4 tile in every open cell.
+        Each child keeps the index of its parent and its slot, (direction) on player levels and (cell, tile) on game levels.\n
+
+        :param board: The given packed 2048 board.
+        :type board: int
+        :param depth: The search depth.
+        :type depth: int
+        :return: The levels, each a dict of the packed boards and, below the root, their parent index and slot.
+        :rtype: list
+        """
+        levels = [{"boards": np.array([board], dtype=np.uint64), "players_turn": True}]
+        for _ in range(depth):
+            level = levels[-1]
+            boards = level["boards"]
+            if level["players_turn"]: # Player's Turn: Tiles shift
+                level["terminal"] = ~canMoveBatch(boards)
+                child_boards, parents, slots = [], [], []
+                for slot, direction in enumerate(DIRECTIONS):
+                    shifted_boards, _, changed = moveBatch(boards, direction)
+                    changed &= ~level["terminal"]
+                    child_boards.append(shifted_boards[changed])
+                    parents.append(np.nonzero(changed)[0])
+                    slots.append(np.full(np.count_nonzero(changed), slot))
+                levels.append({
+                    "boards": np.concatenate(child_boards),
+                    "parents": np.concatenate(parents),
+                    "slots": np.concatenate(slots),
+                    "players_turn": False,
+                })
+            else: # Game's Turn: Random tile spawn, every chance node follows a legal move so it has an open cell
+                open_cells = getExponentsBatch(boards) == 0
+                level["num_open_cells"] = open_cells.sum(axis=1)
+                parents, cells = np.nonzero(open_cells)
+                boards_2 = boards[parents] | (np.uint64(1) << CELL_SHIFTS[cells])
+                boards_4 = boards[parents] | (np.uint64(2) << CELL_SHIFTS[cells])
+                levels.append({
+                    "boards": np.concatenate([boards_2, boards_4]),
+                    "parents": np.concatenate([parents, parents]),
+                    "slots": np.concatenate([cells * 2, cells * 2 + 1]),
+                    "players_turn": True,
+                })
+        return levels
+
+    def __reduceLevels(self, levels: list) -> np.ndarray:
+        """
+        This scores the deepest level with the heuristic and reduces the scores back up to the root.\n
+        Player nodes take the max of their children and game nodes floor the 90% / 10% weighted average of their
+        2 and 4 tile children, with the same integer sums as the recursive search.\n
+
+        :param levels: The levels built by __expandLevels.
+        :type levels: list
+        :return: The score of each of the 4 root directions, 0 for an illegal direction.
+        :rtype: np.ndarray
+        """
+        scores = self.getHeuristicScores(levels[-1]["boards"])
+        for depth in range(len(levels) - 2, -1, -1):
+            level = levels[depth]
+            child_level = levels[depth + 1]
+            num_nodes = len(level["boards"])
+            if level["players_turn"]:
+                child_scores = np.zeros((num_nodes, len(DIRECTIONS)), dtype=np.int64)
+                child_scores[child_level["parents"], child_level["slots"]] = scores
+                if depth == 0: return child_scores[0]
+                scores = np.where(level["terminal"], self.getHeuristicScores(level["boards"]), child_scores.max(axis=1))
+            else:
+                child_scores = np.zeros((num_nodes, 32), dtype=np.int64) # (cell, tile) slots
+                child_scores[child_level["parents"], child_level["slots"]] = scores
+                num_open_cells = level["num_open_cells"]
+                avg_heuristic_2 = child_scores[:, 0::2].sum(axis=1) / num_open_cells
+                avg_heuristic_4 = child_scores[:, 1::2].sum(axis=1) / num_open_cells
+                scores = np.floor(avg_heuristic_2 * self.TILE_2_CHANCE + avg_heuristic_4 * self.TILE_4_CHANCE).astype(np.int64)
+        return np.zeros(len(DIRECTIONS), dtype=np.int64) # A depth of 0 searches nothing
+
+def main():
+    model = Model2048()
+    expectiminimax = VectorExpectiminimax2048(5, 3)
+    while not model.gameOver():
+        model.playAction(expectiminimax.getNextDirectionPacked(model.getPackedBoard()))
+    model.displayBoardScore()
+
+if __name__ == '__main__':
+    main()